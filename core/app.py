@@ -1,7 +1,9 @@
-from flask import Flask
-from core.utils import load_secret
+from flask import Flask, g, request, session
+from core.utils import load_secret, discord_user_refresher
 from core.config import config
 from core.sql import sql
+from core.controller import LineController, OperatorController
+from core.logger import Logger
 
 from core.routes.oauth2 import auth
 from core.routes.api import api
@@ -12,11 +14,25 @@ from core.routes.operators import operators
 import os
 import json
 
+logger = Logger("@requests")
+
 def run_migrations():
     sql.execute_query("ALTER TABLE operator ADD COLUMN IF NOT EXISTS description TEXT NULL")
     sql.execute_query("ALTER TABLE operator ADD COLUMN IF NOT EXISTS image_path VARCHAR(255) NULL")
+    sql.execute_query("ALTER TABLE line ADD COLUMN IF NOT EXISTS notice_html TEXT NULL")
+    LineController.backfill_notice_html()
+    LineController.deduplicate_compositions()
+
+def start_background_tasks():
+    """
+    Start the background threads. Called by App.run() and, in the production
+    server, by every worker process after the fork (threads don't survive it).
+    """
+    discord_user_refresher.start()
+
 
 run_migrations()
+LineController.warm_cache()
 
 app = Flask(
     __name__,
@@ -36,6 +52,56 @@ app.register_blueprint(operators)
 app.register_blueprint(admin)
 
 
+@app.context_processor
+def inject_user_operators():
+    """
+    Expose the operators of the logged in user to all templates (navbar).
+    Resolved lazily from the cached membership index.
+    """
+    def user_operators():
+        user = session.get('user')
+        if not user or 'id' not in user:
+            return []
+        return OperatorController.get_operators_for_user(user['id'])
+
+    return {'user_operators': user_operators}
+
+
+if config.db_query_stats:
+    @app.before_request
+    def start_query_stats():
+        g.query_stats_token = sql.start_query_stats()
+
+    @app.after_request
+    def report_query_stats(response):
+        stats = sql.get_query_stats()
+        if stats is None:
+            return response
+
+        timing = [
+            f'db;dur={stats.db_time * 1000:.2f};desc="{stats.count} queries"',
+            f'db-pool;dur={stats.pool_wait * 1000:.2f}'
+        ]
+        if stats.slowest_query:
+            shape = stats.slowest_query[:100].replace('\\', '').replace('"', "'")
+            timing.append(f'db-slowest;dur={stats.slowest_time * 1000:.2f};desc="{shape}"')
+        response.headers.add('Server-Timing', ', '.join(timing))
+
+        logger.info("query stats " + json.dumps({
+            'method': request.method,
+            'path': request.path,
+            'status': response.status_code,
+            **stats.to_dict()
+        }))
+        return response
+
+    @app.teardown_request
+    def stop_query_stats(exc=None):
+        token = g.pop('query_stats_token', None)
+        if token is not None:
+            sql.stop_query_stats(token)
+
+
 @app.route('/setup.lua')
 def setup_lua():
     with open(os.path.join(os.path.dirname(__file__), '../static/assets/lua/setup.lua')) as f:
@@ -48,6 +114,8 @@ class App:
         self.app = flask_app
 
     def run(self):
+        """Development server. Use gunicorn.conf.py in production."""
+        start_background_tasks()
         self.app.run(
             host=config.host,
             port=config.port,
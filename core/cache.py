@@ -0,0 +1,614 @@
+from typing import Any, Callable, Dict, Optional, Tuple
+from collections import OrderedDict, deque
+from core.logger import Logger
+
+import json
+import os
+import threading
+import time
+
+try:
+    import fcntl
+except ImportError:
+    # Windows, only used by multi-process servers (share_versions())
+    fcntl = None
+
+logger = Logger("@cache")
+
+# Directory of the files that share data versions between worker processes,
+# set by share_versions() (None = single process)
+_shared_version_dir = None
+# How often wait_for_change() looks for versions published by other processes
+SHARED_VERSION_POLL_INTERVAL = 0.5
+
+
+def share_versions(directory: str):
+    """
+    Share data versions between the worker processes of a multi-process
+    server, so that a write in one worker invalidates the caches of all.
+    Must be called before the caches are created (before the app is loaded).
+
+    Args:
+        directory: Directory for the version files, shared by all workers
+    """
+    global _shared_version_dir
+    os.makedirs(directory, exist_ok=True)
+    _shared_version_dir = directory
+
+
+class _SharedVersion:
+    """
+    Data version of one dataset in a file shared by all worker processes.
+    The file holds the latest version and the changes of that version; it
+    is replaced atomically, and increments are serialized with a lock file.
+    """
+
+    def __init__(self, name: str):
+        self.path = os.path.join(_shared_version_dir, f"{name}.json")
+        self._lock_path = self.path + '.lock'
+        # (inode, mtime) of the file when it was last read or written
+        self._seen = None
+
+    def _stat(self):
+        try:
+            stat = os.stat(self.path)
+        except OSError:
+            return None
+        return stat.st_ino, stat.st_mtime_ns
+
+    def _read(self) -> Tuple[int, Optional[Dict[str, str]]]:
+        try:
+            with open(self.path) as f:
+                data = json.load(f)
+            return int(data['version']), data.get('changes')
+        except (OSError, ValueError, KeyError, TypeError):
+            return 0, None
+
+    def poll(self) -> Optional[Tuple[int, Optional[Dict[str, str]]]]:
+        """
+        Returns:
+            (version, changes) if the file changed since it was last seen, else None
+        """
+        seen = self._stat()
+        if seen is None or seen == self._seen:
+            return None
+
+        self._seen = seen
+        return self._read()
+
+    def publish(self, version: int, changes: Optional[Dict[str, str]]) -> int:
+        """
+        Publish the next version after the given local version.
+
+        Returns:
+            The new version, higher than the local and the shared version
+        """
+        with open(self._lock_path, 'a') as lock:
+            fcntl.flock(lock, fcntl.LOCK_EX)
+            try:
+                current = self._read()[0] if self._stat() is not None else 0
+                new_version = max(current, version) + 1
+
+                tmp_path = f"{self.path}.{os.getpid()}.tmp"
+                with open(tmp_path, 'w') as f:
+                    json.dump({'version': new_version, 'changes': changes}, f)
+                os.replace(tmp_path, self.path)
+                self._seen = self._stat()
+            finally:
+                fcntl.flock(lock, fcntl.LOCK_UN)
+
+        return new_version
+
+
+class SnapshotCache:
+    """
+    Versioned in-memory snapshot of a dataset.
+    The snapshot is loaded lazily and kept until it is invalidated by a write.
+    Optionally keeps a bounded log of which keys changed in which version.
+    """
+
+    def __init__(self, name: str, loader: Callable[[], Any], change_log_size: int = 0):
+        """
+        Args:
+            name: Name of the cached dataset (used for logging)
+            loader: Callable that loads the full dataset, returns None on failure
+            change_log_size: Number of invalidations to remember for changes_since()
+        """
+        self.name = name
+        self._loader = loader
+        self._load_lock = threading.Lock()
+        # Condition, so that waiters are woken up by invalidate()
+        self._version_lock = threading.Condition()
+        # Versions start at the current time in milliseconds, so versions handed
+        # out before a restart are never mistaken for current ones
+        self._version = int(time.time() * 1000)
+        self._change_log = deque(maxlen=change_log_size) if change_log_size else None
+        self._change_log_floor = self._version
+        # (data, version it was loaded for), swapped as one tuple
+        self._snapshot = (None, -1)
+        self._derived = {}
+        self._derived_lock = threading.Lock()
+        self._shared = _SharedVersion(name) if _shared_version_dir else None
+
+    @property
+    def version(self) -> int:
+        """Current data version, bumped by every invalidation."""
+        self._sync()
+        return self._version
+
+    def _sync(self):
+        """Adopt a version published by another worker process."""
+        if self._shared is None:
+            return
+
+        published = self._shared.poll()
+        if published is None or published[0] <= self._version:
+            return
+
+        with self._version_lock:
+            version, changes = published
+            if version <= self._version:
+                return
+
+            self._advance(version, changes)
+            logger.debug(f"Adopted {self.name} snapshot version {version} from another worker")
+            self._version_lock.notify_all()
+
+    def _advance(self, version: int, changes: Optional[Dict[str, str]]):
+        """Move to a newer version and log its changes. Call with the version lock held."""
+        if self._change_log is not None:
+            if len(self._change_log) == self._change_log.maxlen:
+                self._change_log_floor = self._change_log[0][0]
+            # The changes are only known if no version was skipped
+            self._change_log.append((version, changes if version == self._version + 1 else None))
+
+        self._version = version
+
+    def is_current(self) -> bool:
+        """Whether get() can return the snapshot without loading it."""
+        self._sync()
+        return self._snapshot[1] == self._version
+
+    def get(self) -> Optional[Any]:
+        """
+        Get the current snapshot, loading it if it is missing or outdated.
+
+        Returns:
+            The cached dataset or None if loading failed
+        """
+        return self._get_with_version()[0]
+
+    def derived(self, key: str, builder: Callable[[Any], Any]) -> Optional[Any]:
+        """
+        Get a value computed from the snapshot, built once per data version.
+
+        Args:
+            key: Name of the derived value
+            builder: Callable that receives the snapshot and returns the value
+
+        Returns:
+            The derived value or None if the snapshot could not be loaded
+
+        Example:
+            body = line_cache.derived('json', lambda lines: json.dumps(lines))
+        """
+        data, version = self._get_with_version()
+        if data is None:
+            return None
+
+        entry = self._derived.get(key)
+        if entry and entry[0] == version:
+            return entry[1]
+
+        with self._derived_lock:
+            entry = self._derived.get(key)
+            if entry and entry[0] == version:
+                return entry[1]
+
+            value = builder(data)
+            self._derived[key] = (version, value)
+            return value
+
+    def _get_with_version(self) -> Tuple[Optional[Any], int]:
+        """Get the snapshot together with the version it was loaded for."""
+        self._sync()
+        data, version = self._snapshot
+        if version == self._version:
+            return data, version
+
+        with self._load_lock:
+            # Another thread may have reloaded while we were waiting
+            version = self._version
+            data, loaded_version = self._snapshot
+            if loaded_version == version:
+                return data, version
+
+            data = self._loader()
+            if data is None:
+                return None, version
+
+            self._snapshot = (data, version)
+            return data, version
+
+    def invalidate(self, changes: Optional[Dict[str, str]] = None) -> int:
+        """
+        Mark the snapshot as outdated. Call this after every committed write.
+
+        Args:
+            changes: Changed keys mapped to an action ('created', 'updated',
+                'deleted'). None means the changed keys are unknown.
+
+        Returns:
+            The new data version
+        """
+        changes = dict(changes) if changes is not None else None
+
+        self._sync()
+        with self._version_lock:
+            if self._shared is not None:
+                version = self._shared.publish(self._version, changes)
+            else:
+                version = self._version + 1
+            self._advance(version, changes)
+
+            logger.debug(f"Invalidated {self.name} snapshot (version {self._version})")
+            self._version_lock.notify_all()
+            return self._version
+
+    def wait_for_change(self, version: int, timeout: float) -> bool:
+        """
+        Block until the version differs from the given one or the timeout ends.
+
+        Args:
+            version: Version the caller is up to date with
+            timeout: Maximum time to wait in seconds
+
+        Returns:
+            True if the version has changed, False on timeout
+        """
+        if self._shared is None:
+            with self._version_lock:
+                return self._version_lock.wait_for(lambda: self._version != version, timeout)
+
+        # Other workers can't notify us, look at the shared version now and then
+        deadline = time.monotonic() + timeout
+        while True:
+            self._sync()
+            remaining = deadline - time.monotonic()
+            with self._version_lock:
+                if self._version_lock.wait_for(lambda: self._version != version,
+                                               min(SHARED_VERSION_POLL_INTERVAL, max(remaining, 0))):
+                    return True
+            if remaining <= 0:
+                return False
+
+    def changes_since(self, version: int) -> Tuple[int, Optional[Dict[str, str]]]:
+        """
+        Get the keys that changed after a given version.
+        Several changes to the same key are merged into one action.
+
+        Args:
+            version: Version the caller is up to date with
+
+        Returns:
+            Tuple of the current version and the changed keys mapped to their
+            action, or None instead of the changes if the caller needs a full
+            reload (version unknown, too old or unknown changes since then)
+        """
+        self._sync()
+        with self._version_lock:
+            current = self._version
+            if version == current:
+                return current, {}
+
+            if self._change_log is None or version > current or version < self._change_log_floor:
+                return current, None
+
+            entries = []
+            for entry_version, entry in reversed(self._change_log):
+                if entry_version <= version:
+                    break
+                if entry is None:
+                    return current, None
+                entries.append(entry)
+
+        changes = {}
+        for entry in reversed(entries):
+            for key, action in entry.items():
+                if action == 'updated' and changes.get(key) == 'created':
+                    continue
+                changes[key] = action
+
+        return current, changes
+
+
+class DataVersion:
+    """
+    Version number of a dataset that isn't held as a snapshot, bumped by
+    every committed write so that values derived from it can be keyed on it.
+    """
+
+    def __init__(self, name: str):
+        """
+        Args:
+            name: Name of the dataset (used for logging)
+        """
+        self.name = name
+        self._lock = threading.Lock()
+        # Starts at the current time in milliseconds, like SnapshotCache versions
+        self._version = int(time.time() * 1000)
+        self._shared = _SharedVersion(name) if _shared_version_dir else None
+        self._external_changes = 0
+
+    @property
+    def version(self) -> int:
+        """Current data version."""
+        self._sync()
+        return self._version
+
+    @property
+    def external_changes(self) -> int:
+        """
+        Number of times the version was changed by another worker process.
+        Lets state this process keeps up to date itself (like a search index)
+        know when to reload.
+        """
+        self._sync()
+        return self._external_changes
+
+    def _sync(self):
+        """Adopt a version published by another worker process."""
+        if self._shared is None:
+            return
+
+        published = self._shared.poll()
+        if published is None:
+            return
+
+        with self._lock:
+            if published[0] > self._version:
+                self._version = published[0]
+                self._external_changes += 1
+
+    def bump(self) -> int:
+        """
+        Mark the dataset as changed.
+
+        Returns:
+            The new data version
+        """
+        self._sync()
+        with self._lock:
+            if self._shared is not None:
+                self._version = self._shared.publish(self._version, None)
+            else:
+                self._version += 1
+            logger.debug(f"Bumped {self.name} version ({self._version})")
+            return self._version
+
+
+class TTLCache:
+    """
+    Thread-safe, size-bounded key/value cache with per-entry expiry.
+    When full, the least recently used entry is evicted.
+    Entries can be kept for stale_ttl seconds past their ttl, so that a
+    stale value can still be served while it is being refreshed.
+    Optionally persisted to a JSON file; writes are batched and done in
+    a background thread so request threads never touch the disk.
+    """
+
+    def __init__(self, name: str, max_size: int, ttl: float, stale_ttl: float = 0,
+                 persist_path: Optional[str] = None, persist_delay: float = 5.0):
+        """
+        Args:
+            name: Name of the cache (used for logging)
+            max_size: Maximum number of entries
+            ttl: Default time in seconds an entry stays fresh
+            stale_ttl: Time in seconds a stale entry is kept for get_stale()
+            persist_path: JSON file to load from and save to (None = memory only)
+            persist_delay: Seconds to collect changes before saving them
+        """
+        self.name = name
+        self.max_size = max_size
+        self.ttl = ttl
+        self.stale_ttl = stale_ttl
+        self._persist_path = persist_path
+        self._persist_delay = persist_delay
+        self._persist_timer = None
+        # False while another process keeps the persist file up to date
+        # (see follow_persist_file()), this one then only reloads it
+        self._persist_writes = True
+        # (inode, mtime) of the persist file when it was last loaded
+        self._persist_seen = None
+        # key -> (value, stale at, expires at) as unix timestamps, oldest use first
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+
+        if persist_path:
+            self._load()
+
+        # Worker processes start without the parent's timer thread
+        if hasattr(os, 'register_at_fork'):
+            os.register_at_fork(after_in_child=self._after_fork)
+
+    def get(self, key: str, default: Any = None) -> Any:
+        """
+        Get a fresh value and mark it as recently used.
+
+        Returns:
+            The cached value or default if it is missing or stale
+        """
+        value, stale = self.get_stale(key, default)
+        return default if stale else value
+
+    def get_stale(self, key: str, default: Any = None) -> Tuple[Any, bool]:
+        """
+        Get a value even if it is stale, and mark it as recently used.
+
+        Returns:
+            Tuple of the cached value (or default if missing or expired)
+            and whether it is stale
+        """
+        now = time.time()
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                return default, False
+
+            if entry[2] <= now:
+                del self._entries[key]
+                return default, False
+
+            self._entries.move_to_end(key)
+            return entry[0], entry[1] <= now
+
+    def stale_in(self, key: str) -> Optional[float]:
+        """
+        Seconds until an entry becomes stale (negative if it already is).
+
+        Returns:
+            The remaining time or None if the key is missing or expired
+        """
+        with self._lock:
+            entry = self._entries.get(key)
+
+        if entry is None or entry[2] <= time.time():
+            return None
+        return entry[1] - time.time()
+
+    def set(self, key: str, value: Any, ttl: Optional[float] = None):
+        """
+        Store a value, evicting the least recently used entries if full.
+
+        Args:
+            key: Cache key
+            value: JSON serializable value if the cache is persisted
+            ttl: Time in seconds the value stays fresh (default: the cache's ttl)
+        """
+        stale_at = time.time() + (self.ttl if ttl is None else ttl)
+
+        with self._lock:
+            self._entries[key] = (value, stale_at, stale_at + self.stale_ttl)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_size:
+                self._entries.popitem(last=False)
+
+        self._schedule_persist()
+
+    def pop(self, key: str):
+        """Remove an entry if present."""
+        with self._lock:
+            removed = self._entries.pop(key, None)
+
+        if removed is not None:
+            self._schedule_persist()
+
+    def clear(self):
+        """Remove all entries."""
+        with self._lock:
+            self._entries.clear()
+
+        self._schedule_persist()
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+    def follow_persist_file(self, follow: bool = True):
+        """
+        Stop (or resume) saving the persist file, when it is shared with
+        another process that keeps it up to date. Changes made by that
+        process are picked up with reload(); when saving is resumed, the
+        entries set in the meantime are saved.
+        """
+        with self._lock:
+            self._persist_writes = not follow
+
+        if not follow:
+            self._schedule_persist()
+
+    def reload(self) -> bool:
+        """
+        Load the entries another process saved to the persist file, if it
+        changed since it was last loaded. Entries are only replaced by
+        fresher ones.
+
+        Returns:
+            Whether the file changed
+        """
+        if not self._persist_path:
+            return False
+
+        try:
+            stat = os.stat(self._persist_path)
+        except OSError:
+            return False
+
+        if (stat.st_ino, stat.st_mtime_ns) == self._persist_seen:
+            return False
+
+        self._load()
+        return True
+
+    def _after_fork(self):
+        self._lock = threading.Lock()
+        self._persist_timer = None
+
+    def _schedule_persist(self):
+        """Save the cache after persist_delay, batching all changes until then."""
+        if not self._persist_path:
+            return
+
+        with self._lock:
+            if self._persist_timer is not None or not self._persist_writes:
+                return
+            self._persist_timer = threading.Timer(self._persist_delay, self._persist)
+            self._persist_timer.daemon = True
+            self._persist_timer.start()
+
+    def _persist(self):
+        """Write all unexpired entries to the persist file (atomically)."""
+        now = time.time()
+        with self._lock:
+            self._persist_timer = None
+            data = {
+                key: {'data': value, 'stale_at': stale_at, 'expires': expires}
+                for key, (value, stale_at, expires) in self._entries.items()
+                if expires > now
+            }
+
+        # One temporary file per process, workers may save at the same time
+        tmp_path = f"{self._persist_path}.{os.getpid()}.tmp"
+        try:
+            with open(tmp_path, 'w') as f:
+                json.dump(data, f)
+            os.replace(tmp_path, self._persist_path)
+        except Exception as e:
+            logger.error(f"Error saving {self.name} cache: {str(e)}")
+
+    def _load(self):
+        """
+        Load unexpired entries from the persist file, if it exists, unless
+        the cache holds a fresher value for the key.
+        """
+        try:
+            stat = os.stat(self._persist_path)
+            with open(self._persist_path) as f:
+                data = json.load(f)
+        except FileNotFoundError:
+            return
+        except Exception as e:
+            logger.warning(f"Could not load {self.name} cache: {str(e)}")
+            return
+
+        now = time.time()
+        with self._lock:
+            self._persist_seen = (stat.st_ino, stat.st_mtime_ns)
+            # Saved in LRU order, so the most recently used entries survive trimming
+            for key, entry in data.items():
+                expires = entry.get('expires', 0)
+                stale_at = entry.get('stale_at', expires)
+                current = self._entries.get(key)
+                if expires > now and (current is None or current[1] < stale_at):
+                    self._entries[key] = (entry.get('data'), stale_at, expires)
+            while len(self._entries) > self.max_size:
+                self._entries.popitem(last=False)
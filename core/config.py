@@ -25,6 +25,14 @@ class Config:
         self.host = webserver_config.get("host", "0.0.0.0")
         self.port = webserver_config.get("port", 30789)
         self.debug = webserver_config.get("debug", False)
+        # Production server (gunicorn.conf.py): worker processes (0 = one per
+        # CPU core) and request threads per worker
+        self.workers = webserver_config.get("workers", 0)
+        self.threads = webserver_config.get("threads", 8)
+        # Open /api/lines/stream connections per process. Each holds a
+        # thread, which the production server adds on top of the request
+        # threads; further clients poll for line changes instead
+        self.max_streams = webserver_config.get("max_streams", 32)
 
         # Administration configuration
         admin_config = config_data.get("administration", {})
@@ -33,6 +41,13 @@ class Config:
         self.maintenance_message = admin_config.get("maintenance_message", "")
         self.readonly = admin_config.get("readonly", False)
 
+        # Logging configuration
+        logging_config = config_data.get("logging", {})
+        # "text" or "json" (one JSON object per line in server.log)
+        self.log_format = logging_config.get("format", "text")
+        # Keep a SQLite index of all records for searching admin logs
+        self.log_index = logging_config.get("index", False)
+
         # Database configuration
         db_config = config_data.get("database", {})
         self.db_host = db_config.get("host", "localhost")
@@ -40,6 +55,12 @@ class Config:
         self.db_user = db_config.get("user")
         self.db_password = db_config.get("password")
         self.db_database = db_config.get("database")
+        # Connections per process. The production server sizes the pools of
+        # its workers to fit into the server's max_connections instead.
+        self.db_pool_size = db_config.get("pool_size", 15)
+        self.db_max_connections = db_config.get("max_connections", 151)
+        # Per-request query count/timing (Server-Timing header and log line)
+        self.db_query_stats = db_config.get("query_stats", False)
 
 
 config = Config()
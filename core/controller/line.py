@@ -1,9 +1,26 @@
-from typing import List, Dict, Any, Optional
-from core.sql import sql
+from typing import List, Dict, Any, Optional, Callable, Tuple
+from core.sql import sql, async_sql
+from core.cache import SnapshotCache
 from core.logger import Logger
+from core.sanitize import sanitize_html
+from core.search import normalize
+
+import re
 
 logger = Logger("@line_controller")
 
+# Homepage board: line types and statuses in display order
+BOARD_TYPES = ('public', 'private', 'metro', 'tram', 'bus')
+BOARD_STATUSES = {
+    'Suspended': 'suspended',
+    'Partially suspended': 'partially_suspended',
+    'Running': 'running',
+    'Possible delays': 'possible_delays',
+    'No scheduled service': 'no_scheduled'
+}
+
+_DIGITS = re.compile(r'\d+')
+
 
 class LineController:
     """
@@ -14,12 +31,260 @@ class LineController:
     @staticmethod
     def get_all_lines() -> List[Dict[str, Any]]:
         """
-        Get all lines from the database with their stations and compositions.
-        Falls back to JSON file if database query fails.
+        Get all lines with their stations and compositions.
+        Served from the in-memory line snapshot, which is reloaded from the
+        database only after a line has been written.
+        
+        Returns:
+            List of line dictionaries (copies, safe to modify)
+        """
+        lines = line_cache.get()
+        if lines is None:
+            return None
+        
+        return [LineController._copy_line(line) for line in lines]
+    
+    @staticmethod
+    def get_lines_version() -> int:
+        """
+        Get the current version of the line data.
+        
+        Returns:
+            Version number, increased on every line change
+        """
+        return line_cache.version
+    
+    @staticmethod
+    def get_derived(key: str, builder: Callable[[List[Dict[str, Any]]], Any]) -> Optional[Any]:
+        """
+        Get a value computed from the line snapshot, built once per version.
+        The builder receives the shared snapshot and must not modify it.
+        
+        Args:
+            key: Name of the derived value
+            builder: Callable that turns the list of lines into the value
+        
+        Returns:
+            The derived value or None if lines could not be loaded
+        """
+        return line_cache.derived(key, builder)
+    
+    @staticmethod
+    async def get_derived_async(key: str, builder: Callable[[List[Dict[str, Any]]], Any]) -> Optional[Any]:
+        """
+        Async get_derived(). Only a reload of the line snapshot goes through
+        the async database layer, a current snapshot is served directly.
+        
+        Args:
+            key: Name of the derived value
+            builder: Callable that turns the list of lines into the value
+        
+        Returns:
+            The derived value or None if lines could not be loaded
+        """
+        if line_cache.is_current():
+            return line_cache.derived(key, builder)
+        
+        return await async_sql.run(line_cache.derived, key, builder)
+    
+    @staticmethod
+    def get_changes_since(version: int) -> Optional[Dict[str, Any]]:
+        """
+        Get the lines that were created, updated or deleted after a version.
+        
+        Args:
+            version: Line data version the client is up to date with
+        
+        Returns:
+            Dictionary with the current 'version' and either the changed lines
+            ('created', 'updated', 'deleted') or, if the version is unknown or
+            too old, 'full': True and all 'lines'. None if lines could not be
+            loaded; the client must then keep its data and version.
+        """
+        current, changes = line_cache.changes_since(version)
+        
+        if changes is None:
+            lines = line_cache.derived('public', LineController._build_public_lines)
+            if lines is None:
+                return None
+            
+            return {
+                'version': current,
+                'full': True,
+                'lines': lines
+            }
+        
+        delta = {
+            'version': current,
+            'full': False,
+            'created': [],
+            'updated': [],
+            'deleted': []
+        }
+        
+        if changes:
+            lines_by_name = line_cache.derived(
+                'by_name', lambda lines: {line['name']: LineController.public_line(line) for line in lines}
+            )
+            if lines_by_name is None:
+                # Every changed line would look deleted
+                return None
+            
+            for name, action in changes.items():
+                line = lines_by_name.get(name)
+                if line is None:
+                    delta['deleted'].append(name)
+                elif action == 'created':
+                    delta['created'].append(line)
+                else:
+                    delta['updated'].append(line)
+        
+        return delta
+    
+    @staticmethod
+    def public_line(line: Dict[str, Any]) -> Dict[str, Any]:
+        """
+        A line as sent to API clients (payload, change feed, stream):
+        without notice_html, which only the templates use.
+        """
+        return {key: value for key, value in line.items() if key != 'notice_html'}
+    
+    @staticmethod
+    def _build_public_lines(lines: List[Dict[str, Any]]) -> List[Dict[str, Any]]:
+        """API view of the line snapshot, see public_line()."""
+        return [LineController.public_line(line) for line in lines]
+    
+    @staticmethod
+    def get_line_board() -> Optional[Dict[str, Dict[str, List[Dict[str, Any]]]]]:
+        """
+        Get the lines grouped by type and status for the homepage, each
+        group in natural order (S2 before S10). Built once per version.
+        
+        Returns:
+            Dictionary of line type -> status -> lines (shared, must not be
+            modified) or None if lines could not be loaded
+        """
+        return line_cache.derived('board', LineController._build_line_board)
+    
+    @staticmethod
+    def _line_sort_key(name: str) -> Tuple[str, List[int]]:
+        """Natural sort key of a line name: letters first, then the numbers in it."""
+        return (
+            ''.join(char for char in name if not char.isdigit()),
+            [int(number) for number in _DIGITS.findall(name)] or [0]
+        )
+    
+    @staticmethod
+    def _build_line_board(lines: List[Dict[str, Any]]) -> Dict[str, Dict[str, List[Dict[str, Any]]]]:
+        """Group and sort the line snapshot for get_line_board()."""
+        board = {line_type: {status: [] for status in BOARD_STATUSES.values()} for line_type in BOARD_TYPES}
+        
+        for line in lines:
+            status_key = BOARD_STATUSES.get(line['status'])
+            line_type = line.get('type', 'public')
+            if not status_key or line_type not in board:
+                continue
+            
+            notice = (line.get('notice') or '').strip()
+            board[line_type][status_key].append({
+                **line,
+                'notice': notice or None,
+                'sort_key': LineController._line_sort_key(line['name'])
+            })
+        
+        for statuses in board.values():
+            for group in statuses.values():
+                group.sort(key=lambda line: line['sort_key'])
+        
+        return board
+    
+    @staticmethod
+    def wait_for_change(version: int, timeout: float) -> bool:
+        """
+        Block until the line data changes after a version or the timeout ends.
+        
+        Args:
+            version: Line data version the caller is up to date with
+            timeout: Maximum time to wait in seconds
+        
+        Returns:
+            True if lines have changed, False on timeout
+        """
+        return line_cache.wait_for_change(version, timeout)
+    
+    @staticmethod
+    def get_line_names_at_station(station_name: str) -> List[str]:
+        """
+        Get the names of all lines serving a station, from the line snapshot.
+        
+        Args:
+            station_name: Name of the station
+        
+        Returns:
+            List of line names
+        """
+        lines = line_cache.get() or []
+        return [line['name'] for line in lines if station_name in line['stations']]
+    
+    @staticmethod
+    def get_line_names_by_operator(operator_uid: str) -> List[str]:
+        """
+        Get the names of all lines of an operator, from the line snapshot.
+        
+        Args:
+            operator_uid: UID of the operator
+        
+        Returns:
+            List of line names
+        """
+        lines = line_cache.get() or []
+        return [line['name'] for line in lines if line['operator_uid'] == operator_uid]
+    
+    @staticmethod
+    def invalidate_cache(updated: Optional[List[str]] = None,
+                         deleted: Optional[List[str]] = None,
+                         created: Optional[List[str]] = None) -> int:
+        """
+        Invalidate the line snapshot. Must be called after every committed
+        write that affects lines, their stations, compositions or operator.
+        Calling it without any line names forces clients of the change feed
+        to reload all lines.
+        
+        Args:
+            updated: Names of updated lines
+            deleted: Names of deleted lines
+            created: Names of created lines
+        
+        Returns:
+            The new line data version
+        """
+        if updated is None and deleted is None and created is None:
+            return line_cache.invalidate()
+        
+        changes = {}
+        for action, names in (('deleted', deleted), ('created', created), ('updated', updated)):
+            for name in names or []:
+                changes[name] = action
+        
+        return line_cache.invalidate(changes)
+    
+    @staticmethod
+    def _copy_line(line: Dict[str, Any]) -> Dict[str, Any]:
+        """Copy a cached line so callers can't modify the shared snapshot."""
+        return {
+            **line,
+            'stations': list(line['stations']),
+            'compositions': [dict(comp) for comp in line['compositions']]
+        }
+    
+    @staticmethod
+    def _load_all_lines() -> Optional[List[Dict[str, Any]]]:
+        """
+        Load all lines from the database with their stations and compositions.
         OPTIMIZED: Uses only 2 queries instead of N+1
         
         Returns:
-            List of line dictionaries
+            List of line dictionaries or None on failure
         """
         try:
             # Query 1: Get all lines with stations in ONE query
@@ -31,6 +296,7 @@ class LineController:
                 l.status,
                 l.type,
                 l.notice,
+                l.notice_html,
                 o.name as operator_name,
                 o.uid as operator_uid,
                 GROUP_CONCAT(DISTINCT s.name ORDER BY ls.station_order SEPARATOR '||') as stations
@@ -38,12 +304,10 @@ class LineController:
             LEFT JOIN operator o ON l.operator_id = o.id
             LEFT JOIN line_station ls ON l.id = ls.line_id
             LEFT JOIN station s ON ls.station_id = s.id
-            GROUP BY l.id, l.name, l.color, l.status, l.type, l.notice, o.name, o.uid
+            GROUP BY l.id, l.name, l.color, l.status, l.type, l.notice, l.notice_html, o.name, o.uid
             ORDER BY l.name
             """
             
-            results = sql.execute_query(query)
-            
             # Query 2: Get ALL compositions for ALL lines in ONE query
             comp_query = """
             SELECT 
@@ -54,7 +318,14 @@ class LineController:
             JOIN composition c ON lc.composition_id = c.id
             ORDER BY lc.line_id, c.id
             """
-            all_compositions = sql.execute_query(comp_query)
+            
+            # Run both queries on one cursor so that a database error raises
+            # instead of caching an empty snapshot
+            with sql.get_cursor() as cursor:
+                cursor.execute(query)
+                results = cursor.fetchall()
+                cursor.execute(comp_query)
+                all_compositions = cursor.fetchall()
             
             # Build composition map: {line_id: [compositions]}
             comp_map = {}
@@ -76,6 +347,8 @@ class LineController:
                     'status': row['status'] or 'Running',
                     'type': row['type'] or 'public',
                     'notice': row['notice'] or '',
+                    # Rows written before notice_html existed are sanitized here until backfilled
+                    'notice_html': row['notice_html'] if row['notice_html'] is not None else sanitize_html(row['notice']),
                     'stations': row['stations'].split('||') if row['stations'] else [],
                     'compositions': comp_map.get(row['id'], []),
                     'operator': row['operator_name'] or '',
@@ -87,6 +360,7 @@ class LineController:
         
         except Exception as e:
             logger.error(f"Error fetching lines from database: {str(e)}")
+            return None
     
     @staticmethod
     def get_line_by_name(line_name: str) -> Optional[Dict[str, Any]]:
@@ -166,6 +440,7 @@ class LineController:
     def get_lines_by_operator(operator_uid: str) -> List[Dict[str, Any]]:
         """
         Get all lines for a specific operator.
+        OPTIMIZED: Uses only 2 queries instead of N+1
         
         Args:
             operator_uid: UID of the operator
@@ -174,6 +449,7 @@ class LineController:
             List of line dictionaries
         """
         try:
+            # Query 1: Get the operator's lines with stations in ONE query
             query = """
             SELECT 
                 l.id,
@@ -194,26 +470,34 @@ class LineController:
             ORDER BY l.name
             """
             
+            
+            # Query 2: Get the compositions of all lines of the operator in ONE query
+            comp_query = """
+            SELECT 
+                lc.line_id,
+                c.parts, 
+                c.name as comp_name
+            FROM line_composition lc
+            JOIN composition c ON lc.composition_id = c.id
+            JOIN line l ON lc.line_id = l.id
+            JOIN operator o ON l.operator_id = o.id
+            WHERE o.uid = %s
+            ORDER BY lc.line_id, c.id
+            """
+            
             results = sql.execute_query(query, (operator_uid,))
+            all_compositions = sql.execute_query(comp_query, (operator_uid,)) if results else []
+            
+            # Build composition map: {line_id: [compositions]}
+            comp_map = {}
+            for comp in all_compositions:
+                comp_map.setdefault(comp['line_id'], []).append({
+                    'name': comp['comp_name'] or '',
+                    'parts': comp['parts']
+                })
             
             lines = []
             for row in results:
-                comp_query = """
-                SELECT c.parts, c.name as comp_name
-                FROM line_composition lc
-                JOIN composition c ON lc.composition_id = c.id
-                WHERE lc.line_id = %s
-                ORDER BY c.id
-                """
-                compositions_raw = sql.execute_query(comp_query, (row['id'],))
-                
-                compositions = []
-                for comp in compositions_raw:
-                    compositions.append({
-                        'name': comp['comp_name'] or '',
-                        'parts': comp['parts']
-                    })
-                
                 line = {
                     'name': row['name'],
                     'color': row['color'],
@@ -221,7 +505,7 @@ class LineController:
                     'type': row['type'] or 'public',
                     'notice': row['notice'] or '',
                     'stations': row['stations'].split('||') if row['stations'] else [],
-                    'compositions': compositions,
+                    'compositions': comp_map.get(row['id'], []),
                     'operator': row['operator_name'] or '',
                     'operator_uid': row['operator_uid'] or ''
                 }
@@ -283,62 +567,26 @@ class LineController:
                 'status': line_data.get('status', 'Running'),
                 'type': line_data.get('type', 'public'),
                 'notice': line_data.get('notice', ''),
+                # Sanitized once here instead of on every page view
+                'notice_html': sanitize_html(line_data.get('notice', '')),
                 'operator_id': operator['id']
             }
             
-            line_id = sql.insert('line', line_insert_data)
-            if not line_id:
-                logger.error("Failed to insert line")
-                return None
-            
-            # Insert stations if provided
-            if 'stations' in line_data and line_data['stations']:
-                for order, station_name in enumerate(line_data['stations']):
-                    # Get or create station
-                    station = sql.select_one('station', where={'name': station_name})
-                    if not station:
-                        station_id = sql.insert('station', {'name': station_name})
-                    else:
-                        station_id = station['id']
-                    
-                    # Link station to line
-                    sql.insert('line_station', {
-                        'line_id': line_id,
-                        'station_id': station_id,
-                        'station_order': order
-                    })
-            
-            # Insert compositions if provided
-            if 'compositions' in line_data and line_data['compositions']:
-                for comp in line_data['compositions']:
-                    if isinstance(comp, dict):
-                        # New format: {name: '', parts: ''}
-                        comp_name = comp.get('name', '')
-                        comp_parts = comp.get('parts', '')
-                    else:
-                        # Old format: just the parts string
-                        comp_name = ''
-                        comp_parts = comp
-                    
-                    # Get or create composition
-                    composition = sql.select_one('composition', where={
-                        'parts': comp_parts,
-                        'name': comp_name
-                    })
-                    if not composition:
-                        composition_id = sql.insert('composition', {
-                            'parts': comp_parts,
-                            'name': comp_name
-                        })
-                    else:
-                        composition_id = composition['id']
-                    
-                    # Link composition to line
-                    sql.insert('line_composition', {
-                        'line_id': line_id,
-                        'composition_id': composition_id
-                    })
+            with sql.transaction():
+                line_id = sql.insert('line', line_insert_data)
+                if not line_id:
+                    logger.error("Failed to insert line")
+                    return None
+                
+                # Insert stations if provided
+                if 'stations' in line_data and line_data['stations']:
+                    LineController._link_stations(line_id, line_data['stations'])
+                
+                # Insert compositions if provided
+                if 'compositions' in line_data and line_data['compositions']:
+                    LineController._link_compositions(line_id, line_data['compositions'])
             
+            LineController.invalidate_cache(created=[line_data['name']])
             return line_id
         
         except Exception as e:
@@ -378,66 +626,303 @@ class LineController:
                 update_data['type'] = line_data['type']
             if 'notice' in line_data:
                 update_data['notice'] = line_data['notice']
+                update_data['notice_html'] = sanitize_html(line_data['notice'])
             
-            if update_data:
-                sql.update('line', update_data, {'id': line_id})
-            
-            # Update stations if provided
-            if 'stations' in line_data:
-                # Remove old stations
-                sql.delete('line_station', {'line_id': line_id})
+            with sql.transaction():
+                if update_data:
+                    sql.update('line', update_data, {'id': line_id})
                 
-                # Add new stations
-                for order, station_name in enumerate(line_data['stations']):
-                    station = sql.select_one('station', where={'name': station_name})
-                    if not station:
-                        station_id = sql.insert('station', {'name': station_name})
-                    else:
-                        station_id = station['id']
-                    
-                    sql.insert('line_station', {
-                        'line_id': line_id,
-                        'station_id': station_id,
-                        'station_order': order
-                    })
-            
-            # Update compositions if provided
-            if 'compositions' in line_data:
-                # Remove old compositions
-                sql.delete('line_composition', {'line_id': line_id})
+                # Update stations if provided
+                if 'stations' in line_data:
+                    LineController._link_stations(line_id, line_data['stations'], replace=True)
                 
-                # Add new compositions
-                for comp in line_data['compositions']:
-                    if isinstance(comp, dict):
-                        comp_name = comp.get('name', '')
-                        comp_parts = comp.get('parts', '')
-                    else:
-                        comp_name = ''
-                        comp_parts = comp
-                    
-                    composition = sql.select_one('composition', where={
-                        'parts': comp_parts,
-                        'name': comp_name
-                    })
-                    if not composition:
-                        composition_id = sql.insert('composition', {
-                            'parts': comp_parts,
-                            'name': comp_name
-                        })
-                    else:
-                        composition_id = composition['id']
-                    
-                    sql.insert('line_composition', {
-                        'line_id': line_id,
-                        'composition_id': composition_id
-                    })
+                # Update compositions if provided
+                if 'compositions' in line_data:
+                    LineController._link_compositions(line_id, line_data['compositions'], replace=True)
             
+            new_name = line_data.get('name', line_name)
+            if new_name != line_name:
+                LineController.invalidate_cache(updated=[new_name], deleted=[line_name])
+            else:
+                LineController.invalidate_cache(updated=[line_name])
             return True
         
         except Exception as e:
             logger.error(f"Error updating line '{line_name}': {str(e)}")
             return False
     
+    @staticmethod
+    def _link_stations(line_id: int, station_names: List[str], replace: bool = False):
+        """
+        Link stations to a line in the given order, creating missing stations.
+        Uses set-based statements on a single cursor: one lookup, one
+        multi-row insert of new stations and one batch insert of the
+        line-station links. Joins the caller's transaction if there is one.
+        
+        Names are matched by the database (the station collation also treats
+        case, accent variants and trailing spaces as equal), never in Python.
+        
+        Args:
+            line_id: ID of the line
+            station_names: Station names in line order
+            replace: Remove the line's existing station links first
+        """
+        unique_names = list(dict.fromkeys(station_names))
+        station_ids = {}
+        
+        def resolve(cursor, names):
+            """Find the stations of names; returns the names without one."""
+            pending = list(names)
+            while pending:
+                placeholders = ', '.join(['%s'] * len(pending))
+                # FIELD() compares with the column collation like IN, its result
+                # tells which requested name a row matched
+                cursor.execute(
+                    f"SELECT id, FIELD(name, {placeholders}) as position FROM station "
+                    f"WHERE name IN ({placeholders}) ORDER BY id",
+                    tuple(pending) * 2
+                )
+                for row in cursor.fetchall():
+                    if row['position']:
+                        station_ids.setdefault(pending[row['position'] - 1], row['id'])
+                
+                # FIELD() only reports the first of several requested names
+                # the collation considers equal, the others go another round
+                remaining = [name for name in pending if name not in station_ids]
+                if len(remaining) == len(pending):
+                    break
+                pending = remaining
+            return pending
+        
+        with sql.get_cursor() as cursor:
+            if replace:
+                cursor.execute("DELETE FROM line_station WHERE line_id = %s", (line_id,))
+            
+            if not unique_names:
+                return
+            
+            missing = resolve(cursor, unique_names)
+            
+            if missing:
+                created = []
+                while missing:
+                    # Names the collation considers equal must only be inserted
+                    # once; names this coarser key wrongly merged go another round
+                    batch = {}
+                    for name in missing:
+                        batch.setdefault(normalize(name), name)
+                    cursor.executemany(
+                        "INSERT INTO station (name) VALUES (%s)",
+                        [(name,) for name in batch.values()]
+                    )
+                    created.extend(batch.values())
+                    
+                    remaining = resolve(cursor, missing)
+                    if len(remaining) == len(missing):
+                        raise RuntimeError("Inserted stations could not be found")
+                    missing = remaining
+                
+                from core.controller.station import StationController
+                for name in created:
+                    StationController.update_search_index(station_ids[name], name)
+                StationController.mark_changed()
+            
+            cursor.executemany(
+                "INSERT INTO line_station (line_id, station_id, station_order) VALUES (%s, %s, %s)",
+                [(line_id, station_ids[name], order) for order, name in enumerate(station_names)]
+            )
+    
+    @staticmethod
+    def _composition_key(parts: Optional[str], name: Optional[str]) -> Tuple[str, str]:
+        """Key of a composition in the composition index (case-insensitive like the collation)."""
+        return (parts or '').casefold(), (name or '').casefold()
+    
+    @staticmethod
+    def _load_composition_index() -> Optional[Dict[Tuple[str, str], int]]:
+        """
+        Load the composition index from the database.
+        
+        Returns:
+            Dictionary mapping (parts, name) keys to composition IDs or None on failure
+        """
+        try:
+            with sql.get_cursor() as cursor:
+                cursor.execute("SELECT id, parts, name FROM composition ORDER BY id")
+                rows = cursor.fetchall()
+            
+            index = {}
+            for row in rows:
+                index.setdefault(LineController._composition_key(row['parts'], row['name']), row['id'])
+            
+            return index
+        
+        except Exception as e:
+            logger.error(f"Error loading composition index: {str(e)}")
+            return None
+    
+    @staticmethod
+    def _link_compositions(line_id: int, compositions: List[Any], replace: bool = False):
+        """
+        Link compositions to a line, creating missing compositions.
+        Known compositions are resolved from the in-memory composition index;
+        new ones are written with one INSERT ... ON DUPLICATE KEY batch (the
+        unique key on (parts, name) turns compositions created meanwhile by
+        another worker into no-ops) and the links with one batch insert.
+        Joins the caller's transaction if there is one.
+        
+        Args:
+            line_id: ID of the line
+            compositions: Compositions as {name, parts} dicts or plain parts strings
+            replace: Remove the line's existing composition links first
+        """
+        pairs = []
+        for comp in compositions:
+            if isinstance(comp, dict):
+                # New format: {name: '', parts: ''}
+                pairs.append((comp.get('parts') or '', comp.get('name') or ''))
+            else:
+                # Old format: just the parts string
+                pairs.append((comp or '', ''))
+        
+        index = composition_cache.get() or {}
+        key = LineController._composition_key
+        
+        missing = {}
+        for parts, name in pairs:
+            if key(parts, name) not in index:
+                missing.setdefault(key(parts, name), (parts, name))
+        missing = list(missing.values())
+        
+        with sql.get_cursor() as cursor:
+            if replace:
+                cursor.execute("DELETE FROM line_composition WHERE line_id = %s", (line_id,))
+            
+            if not pairs:
+                return
+            
+            new_ids = {}
+            if missing:
+                cursor.executemany(
+                    "INSERT INTO composition (parts, name) VALUES (%s, %s) ON DUPLICATE KEY UPDATE id = id",
+                    missing
+                )
+                if cursor.rowcount > 0:
+                    # Reloaded by every worker once the new rows are committed
+                    sql.on_commit(composition_cache.invalidate)
+                
+                cursor.execute(
+                    f"SELECT id, parts, name FROM composition WHERE (parts, name) IN ({', '.join(['(%s, %s)'] * len(missing))})",
+                    tuple(value for pair in missing for value in pair)
+                )
+                for row in cursor.fetchall():
+                    new_ids[key(row['parts'], row['name'])] = row['id']
+                
+                # The collation also treats e.g. accent variants as equal,
+                # those don't match by key and are looked up one by one
+                for parts, name in missing:
+                    if key(parts, name) not in new_ids:
+                        cursor.execute(
+                            "SELECT id FROM composition WHERE parts = %s AND name = %s",
+                            (parts, name)
+                        )
+                        row = cursor.fetchone()
+                        if row is None:
+                            raise RuntimeError(f"Composition {name or parts} could not be resolved")
+                        new_ids[key(parts, name)] = row['id']
+            
+            cursor.executemany(
+                "INSERT INTO line_composition (line_id, composition_id) VALUES (%s, %s)",
+                [(line_id, index.get(key(parts, name)) or new_ids.get(key(parts, name))) for parts, name in pairs]
+            )
+    
+    @staticmethod
+    def deduplicate_compositions() -> int:
+        """
+        Merge compositions with the same parts and name (as compared by the
+        column collation) and add the unique key _link_compositions relies
+        on. Safe to run repeatedly.
+        
+        Returns:
+            Number of removed duplicates
+        """
+        try:
+            with sql.get_cursor() as cursor:
+                # NULLs are never equal in a unique key, '' is used instead
+                cursor.execute(
+                    "UPDATE composition SET parts = COALESCE(parts, ''), name = COALESCE(name, '') "
+                    "WHERE parts IS NULL OR name IS NULL"
+                )
+                cursor.execute("""
+                SELECT c.id, k.id as keep_id
+                FROM composition c
+                JOIN (SELECT MIN(id) as id, parts, name FROM composition GROUP BY parts, name) k
+                  ON c.parts = k.parts AND c.name = k.name AND c.id <> k.id
+                """)
+                duplicates = cursor.fetchall()
+                
+                if duplicates:
+                    cursor.executemany(
+                        "UPDATE line_composition SET composition_id = %s WHERE composition_id = %s",
+                        [(row['keep_id'], row['id']) for row in duplicates]
+                    )
+                    cursor.executemany(
+                        "DELETE FROM composition WHERE id = %s",
+                        [(row['id'],) for row in duplicates]
+                    )
+                
+                cursor.execute(
+                    "ALTER TABLE composition ADD UNIQUE INDEX IF NOT EXISTS composition_parts_name (parts, name) USING HASH"
+                )
+            
+            if duplicates:
+                logger.info(f"Merged {len(duplicates)} duplicate compositions")
+                composition_cache.invalidate()
+                LineController.invalidate_cache()
+            return len(duplicates)
+        
+        except Exception as e:
+            logger.error(f"Error deduplicating compositions: {str(e)}")
+            return 0
+    
+    @staticmethod
+    def backfill_notice_html(batch_size: int = 500) -> int:
+        """
+        Store the sanitized notice of lines that don't have one yet (written
+        before notice_html existed). Safe to run repeatedly; to re-sanitize
+        all notices after changing the whitelist, set notice_html to NULL.
+        
+        Args:
+            batch_size: Number of lines updated per statement batch
+        
+        Returns:
+            Number of updated lines
+        """
+        try:
+            with sql.get_cursor() as cursor:
+                cursor.execute("SELECT id, notice FROM line WHERE notice_html IS NULL")
+                rows = cursor.fetchall()
+                
+                for start in range(0, len(rows), batch_size):
+                    cursor.executemany(
+                        "UPDATE line SET notice_html = %s WHERE id = %s",
+                        [(sanitize_html(row['notice']), row['id']) for row in rows[start:start + batch_size]]
+                    )
+            
+            if rows:
+                logger.info(f"Backfilled sanitized notices of {len(rows)} lines")
+                LineController.invalidate_cache()
+            return len(rows)
+        
+        except Exception as e:
+            logger.error(f"Error backfilling sanitized notices: {str(e)}")
+            return 0
+    
+    @staticmethod
+    def warm_cache():
+        """Load the line snapshot and the composition index ahead of the first request."""
+        line_cache.get()
+        composition_cache.get()
+    
     @staticmethod
     def delete_line(line_name: str) -> bool:
         """
@@ -457,16 +942,18 @@ class LineController:
             
             line_id = line['id']
             
-            # Delete related records (cascading delete)
-            sql.delete('line_station', {'line_id': line_id})
-            sql.delete('line_composition', {'line_id': line_id})
-            
-            # Delete the line itself
-            success = sql.delete_by_id('line', line_id)
-            
-            if not success:
-                logger.error(f"Failed to delete line '{line_name}'")
+            with sql.transaction():
+                # Delete related records (cascading delete)
+                sql.delete('line_station', {'line_id': line_id})
+                sql.delete('line_composition', {'line_id': line_id})
+                
+                # Delete the line itself
+                success = sql.delete_by_id('line', line_id)
+                
+                if not success:
+                    logger.error(f"Failed to delete line '{line_name}'")
             
+            LineController.invalidate_cache(deleted=[line_name])
             return success
         
         except Exception as e:
@@ -508,3 +995,7 @@ class LineController:
         except Exception as e:
             logger.error(f"Error counting lines: {str(e)}")
             return 0
+
+
+line_cache = SnapshotCache("lines", LineController._load_all_lines, change_log_size=1000)
+composition_cache = SnapshotCache("compositions", LineController._load_composition_index)
@@ -1,5 +1,6 @@
 from typing import List, Dict, Any, Optional
-from core.sql import sql
+from core.sql import sql, async_sql
+from core.cache import SnapshotCache
 from core.logger import Logger
 
 
@@ -15,12 +16,91 @@ class OperatorController:
     @staticmethod
     def get_all_operators() -> List[Dict[str, Any]]:
         """
-        Get all operators from the database with their users.
-        Falls back to JSON file if database query fails.
+        Get all operators with their users.
+        Served from the in-memory operator snapshot, which is reloaded from
+        the database only after an operator has been written.
+        
+        Returns:
+            List of operator dictionaries (copies, safe to modify)
+        """
+        operators = operator_cache.get()
+        if operators is None:
+            return None
+        
+        return [OperatorController._copy_operator(op) for op in operators]
+    
+    @staticmethod
+    async def get_all_operators_async() -> List[Dict[str, Any]]:
+        """
+        Async get_all_operators(). Only a reload of the operator snapshot
+        goes through the async database layer.
+        
+        Returns:
+            List of operator dictionaries (copies, safe to modify)
+        """
+        if operator_cache.is_current():
+            return OperatorController.get_all_operators()
+        
+        return await async_sql.run(OperatorController.get_all_operators)
+    
+    @staticmethod
+    def get_operators_for_user(user_id: str) -> List[Dict[str, Any]]:
+        """
+        Get all operators a user belongs to, from the cached membership index.
+        Costs no database work while the operator snapshot is current.
+        
+        Args:
+            user_id: Discord ID of the user
+        
+        Returns:
+            List of operator dictionaries (copies, safe to modify)
+        """
+        index = operator_cache.derived('by_user', OperatorController._build_user_index) or {}
+        return [OperatorController._copy_operator(op) for op in index.get(str(user_id), [])]
+    
+    @staticmethod
+    def get_operators_version() -> int:
+        """
+        Get the current version of the operator data.
+        
+        Returns:
+            Version number, increased on every operator change
+        """
+        return operator_cache.version
+    
+    @staticmethod
+    def invalidate_cache() -> int:
+        """
+        Invalidate the operator snapshot and membership index.
+        Must be called after every committed write to operators or their users.
+        
+        Returns:
+            The new operator data version
+        """
+        return operator_cache.invalidate()
+    
+    @staticmethod
+    def _copy_operator(operator: Dict[str, Any]) -> Dict[str, Any]:
+        """Copy a cached operator so callers can't modify the shared snapshot."""
+        return {**operator, 'users': list(operator['users'])}
+    
+    @staticmethod
+    def _build_user_index(operators: List[Dict[str, Any]]) -> Dict[str, List[Dict[str, Any]]]:
+        """Build the user_id -> operators membership index from the snapshot."""
+        index = {}
+        for operator in operators:
+            for user_id in operator['users']:
+                index.setdefault(user_id, []).append(operator)
+        return index
+    
+    @staticmethod
+    def _load_all_operators() -> Optional[List[Dict[str, Any]]]:
+        """
+        Load all operators from the database with their users.
         OPTIMIZED: Uses only 2 queries instead of N+1
         
         Returns:
-            List of operator dictionaries
+            List of operator dictionaries or None on failure
         """
         try:
             # Query 1: Get all operators
@@ -29,7 +109,6 @@ class OperatorController:
             FROM operator o
             ORDER BY o.name
             """
-            operators_raw = sql.execute_query(operators_query)
             
             # Query 2: Get ALL users for ALL operators in ONE query
             all_users_query = """
@@ -38,7 +117,14 @@ class OperatorController:
             JOIN user u ON ou.user_id = u.id
             ORDER BY ou.operator_id
             """
-            all_users = sql.execute_query(all_users_query)
+            
+            # Run both queries on one cursor so that a database error raises
+            # instead of caching an empty snapshot
+            with sql.get_cursor() as cursor:
+                cursor.execute(operators_query)
+                operators_raw = cursor.fetchall()
+                cursor.execute(all_users_query)
+                all_users = cursor.fetchall()
             
             # Build user map: {operator_id: [user_ids]}
             user_map = {}
@@ -66,6 +152,7 @@ class OperatorController:
         
         except Exception as e:
             logger.error(f"Error fetching operators from database: {str(e)}")
+            return None
     
     @staticmethod
     def get_operator_by_uid(operator_uid: str) -> Optional[Dict[str, Any]]:
@@ -169,6 +256,7 @@ class OperatorController:
     def get_operators_by_user(user_id: str) -> List[Dict[str, Any]]:
         """
         Get all operators that a specific user belongs to.
+        OPTIMIZED: Uses only 2 queries instead of N+1
         
         Args:
             user_id: Discord ID of the user
@@ -177,6 +265,7 @@ class OperatorController:
             List of operator dictionaries
         """
         try:
+            # Query 1: Get the user's operators
             operators_query = """
             SELECT DISTINCT o.id, o.name, o.color, o.short, o.uid
             FROM operator o
@@ -185,23 +274,31 @@ class OperatorController:
             WHERE u.id = %s
             ORDER BY o.name
             """
+            
+            # Query 2: Get ALL users of those operators in ONE query
+            users_query = """
+            SELECT ou.operator_id, u.id as user_id
+            FROM operator_user ou
+            JOIN user u ON ou.user_id = u.id
+            JOIN operator_user mine ON mine.operator_id = ou.operator_id
+            WHERE mine.user_id = %s
+            ORDER BY ou.operator_id
+            """
+            
             operators_raw = sql.execute_query(operators_query, (user_id,))
+            all_users = sql.execute_query(users_query, (user_id,)) if operators_raw else []
+            
+            # Build user map: {operator_id: [user_ids]}
+            user_map = {}
+            for user in all_users:
+                user_map.setdefault(user['operator_id'], []).append(str(user['user_id']))
             
             operators = []
             for op in operators_raw:
-                # Get all users for this operator
-                users_query = """
-                SELECT u.id
-                FROM operator_user ou
-                JOIN user u ON ou.user_id = u.id
-                WHERE ou.operator_id = %s
-                """
-                users_raw = sql.execute_query(users_query, (op['id'],))
-                
                 operator = {
                     'name': op['name'],
                     'color': op['color'] or '#808080',
-                    'users': [str(user['id']) for user in users_raw],
+                    'users': user_map.get(op['id'], []),
                     'short': op['short'] or '',
                     'uid': op['uid']
                 }
@@ -235,29 +332,31 @@ class OperatorController:
                 'short': operator_data.get('short', '')
             }
             
-            operator_id = sql.insert('operator', operator_insert_data)
-            if not operator_id:
-                logger.error("Failed to insert operator")
-                return None
-            
-            # Add users if provided
-            if 'users' in operator_data and operator_data['users']:
-                for user_id in operator_data['users']:
-                    # Get or create user
-                    user = sql.select_one('user', where={'id': str(user_id)})
-                    if not user:
-                        # Create user entry
-                        user_insert_id = sql.insert('user', {'id': str(user_id)})
-                        if not user_insert_id:
-                            logger.warning(f"Could not create user entry for {user_id}")
-                            continue
-                    
-                    # Link user to operator
-                    sql.insert('operator_user', {
-                        'operator_id': operator_id,
-                        'user_id': str(user_id)
-                    })
-            
+            with sql.transaction():
+                operator_id = sql.insert('operator', operator_insert_data)
+                if not operator_id:
+                    logger.error("Failed to insert operator")
+                    return None
+                
+                # Add users if provided
+                if 'users' in operator_data and operator_data['users']:
+                    for user_id in operator_data['users']:
+                        # Get or create user
+                        user = sql.select_one('user', where={'id': str(user_id)})
+                        if not user:
+                            # Create user entry
+                            user_insert_id = sql.insert('user', {'id': str(user_id)})
+                            if not user_insert_id:
+                                logger.warning(f"Could not create user entry for {user_id}")
+                                continue
+                        
+                        # Link user to operator
+                        sql.insert('operator_user', {
+                            'operator_id': operator_id,
+                            'user_id': str(user_id)
+                        })
+            
+            OperatorController.invalidate_cache()
             return operator_id
         
         except Exception as e:
@@ -300,28 +399,37 @@ class OperatorController:
             if 'image_path' in operator_data:
                 update_data['image_path'] = operator_data['image_path']
             
-            if update_data:
-                sql.update('operator', update_data, {'id': operator_id})
+            # Lines carry the operator name and uid
+            from core.controller import LineController
+            affected_lines = LineController.get_line_names_by_operator(operator_uid)
             
-            # Update users if provided
-            if 'users' in operator_data:
-                # Remove old user associations
-                sql.delete('operator_user', {'operator_id': operator_id})
+            with sql.transaction():
+                if update_data:
+                    sql.update('operator', update_data, {'id': operator_id})
                 
-                # Add new user associations
-                for user_id in operator_data['users']:
-                    # Get or create user
-                    user = sql.select_one('user', where={'id': str(user_id)})
-                    if not user:
-                        user_insert_id = sql.insert('user', {'id': str(user_id)})
-                        if not user_insert_id:
-                            logger.warning(f"Could not create user entry for {user_id}")
-                            continue
+                # Update users if provided
+                if 'users' in operator_data:
+                    # Remove old user associations
+                    sql.delete('operator_user', {'operator_id': operator_id})
                     
-                    sql.insert('operator_user', {
-                        'operator_id': operator_id,
-                        'user_id': str(user_id)
-                    })
+                    # Add new user associations
+                    for user_id in operator_data['users']:
+                        # Get or create user
+                        user = sql.select_one('user', where={'id': str(user_id)})
+                        if not user:
+                            user_insert_id = sql.insert('user', {'id': str(user_id)})
+                            if not user_insert_id:
+                                logger.warning(f"Could not create user entry for {user_id}")
+                                continue
+                        
+                        sql.insert('operator_user', {
+                            'operator_id': operator_id,
+                            'user_id': str(user_id)
+                        })
+            
+            OperatorController.invalidate_cache()
+            if 'name' in update_data or 'uid' in update_data:
+                LineController.invalidate_cache(updated=affected_lines)
             
             return True
         
@@ -348,21 +456,29 @@ class OperatorController:
             
             operator_id = operator['id']
             
-            # Delete related records
-            sql.delete('operator_user', {'operator_id': operator_id})
-            
-            # Check if operator has lines
-            line_count = sql.count('line', {'operator_id': operator_id})
-            if line_count > 0:
-                logger.warning(f"Operator '{operator_uid}' has {line_count} lines. Consider reassigning or deleting them first.")
-                # Optionally, we could delete the lines or set operator_id to NULL
-                # For now, we'll just log the warning and proceed
+            from core.controller import LineController
+            affected_lines = LineController.get_line_names_by_operator(operator_uid)
             
-            # Delete the operator itself
-            success = sql.delete_by_id('operator', operator_id)
+            with sql.transaction():
+                # Delete related records
+                sql.delete('operator_user', {'operator_id': operator_id})
+                
+                # Check if operator has lines
+                line_count = sql.count('line', {'operator_id': operator_id})
+                if line_count > 0:
+                    logger.warning(f"Operator '{operator_uid}' has {line_count} lines. Consider reassigning or deleting them first.")
+                    # Optionally, we could delete the lines or set operator_id to NULL
+                    # For now, we'll just log the warning and proceed
+                
+                # Delete the operator itself
+                success = sql.delete_by_id('operator', operator_id)
+                
+                if not success:
+                    logger.error(f"Failed to delete operator '{operator_uid}'")
             
-            if not success:
-                logger.error(f"Failed to delete operator '{operator_uid}'")
+            OperatorController.invalidate_cache()
+            if line_count > 0:
+                LineController.invalidate_cache(updated=affected_lines)
             
             return success
         
@@ -400,21 +516,23 @@ class OperatorController:
                 logger.warning(f"User '{user_id}' already belongs to operator '{operator_uid}'")
                 return True
             
-            # Get or create user
-            user = sql.select_one('user', where={'id': str(user_id)})
-            if not user:
-                user_insert_id = sql.insert('user', {'id': str(user_id)})
-                if not user_insert_id:
-                    logger.error(f"Could not create user entry for {user_id}")
-                    return False
-            
-            # Add user to operator
-            result = sql.insert('operator_user', {
-                'operator_id': operator_id,
-                'user_id': str(user_id)
-            })
+            with sql.transaction():
+                # Get or create user
+                user = sql.select_one('user', where={'id': str(user_id)})
+                if not user:
+                    user_insert_id = sql.insert('user', {'id': str(user_id)})
+                    if not user_insert_id:
+                        logger.error(f"Could not create user entry for {user_id}")
+                        return False
+                
+                # Add user to operator
+                result = sql.insert('operator_user', {
+                    'operator_id': operator_id,
+                    'user_id': str(user_id)
+                })
             
             if result:
+                OperatorController.invalidate_cache()
                 return True
             else:
                 logger.error(f"Failed to add user '{user_id}' to operator '{operator_uid}'")
@@ -451,6 +569,7 @@ class OperatorController:
             })
             
             if count > 0:
+                OperatorController.invalidate_cache()
                 return True
             else:
                 logger.warning(f"User '{user_id}' was not a member of operator '{operator_uid}'")
@@ -527,3 +646,6 @@ class OperatorController:
         except Exception as e:
             logger.error(f"Error fetching lines for operator '{operator_uid}': {str(e)}")
             return []
+
+
+operator_cache = SnapshotCache("operators", OperatorController._load_all_operators)
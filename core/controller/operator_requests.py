@@ -64,6 +64,22 @@ class OperatorRequestController:
             logger.error(f"Error fetching operator requests: {str(e)}")
             return []
     
+    @staticmethod
+    def get_requester_ids() -> List[str]:
+        """
+        Get the Discord IDs of all users who have requested an operator.
+        
+        Returns:
+            List of distinct requester IDs
+        """
+        try:
+            results = sql.execute_query("SELECT DISTINCT requester_id FROM operator_request")
+            return [str(row['requester_id']) for row in results]
+        
+        except Exception as e:
+            logger.error(f"Error fetching operator requesters: {str(e)}")
+            return []
+    
     @staticmethod
     def get_request_by_timestamp(timestamp: str) -> Optional[Dict[str, Any]]:
         """
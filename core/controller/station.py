@@ -1,6 +1,11 @@
 from typing import List, Dict, Any, Optional
-from core.sql import sql
+from core.sql import sql, async_sql
+from core.cache import DataVersion
+from core.search import SearchIndex
 from core.logger import Logger
+from core.controller.line import LineController
+
+import asyncio
 
 logger = Logger("@station_controller")
 
@@ -22,28 +27,49 @@ class StationController:
         try:
             query = """
             SELECT S.id, S.name, S.alt_name, S.description, S.type, 
-                   S.status, S.platform_count, S.symbol, S.image_path,
-                   GROUP_CONCAT(DISTINCT L.name ORDER BY L.name SEPARATOR ', ') as `lines`
+                   S.status, S.platform_count, S.symbol, S.image_path
             FROM station S
-            LEFT JOIN line_station LS ON S.id = LS.station_id
-            LEFT JOIN line L ON LS.line_id = L.id
-            GROUP BY S.id, S.name, S.alt_name, S.description, S.type, 
-                     S.status, S.platform_count, S.symbol, S.image_path
             ORDER BY S.name
             """
             
             stations = sql.execute_query(query)
-            # Convert `lines` from a concatenated string to a Python list
+            # Serving lines come from the connectivity index instead of a join
+            index = LineController.get_derived('station_connectivity', StationController._build_connectivity_index) or {}
             for station in stations:
-                lines_field = station.get('lines')
-                if lines_field is None:
-                    station['lines'] = []
-                elif isinstance(lines_field, str):
-                    station['lines'] = [part.strip() for part in lines_field.split(',') if part.strip()]
-                elif isinstance(lines_field, (list, tuple)):
-                    station['lines'] = list(lines_field)
-                else:
-                    station['lines'] = []
+                connectivity = index.get(station['name'], {})
+                station['lines'] = [line['name'] for line in connectivity.get('lines', [])]
+
+            return stations
+        
+        except Exception as e:
+            logger.error(f"Error fetching stations from database: {str(e)}")
+            return []
+    
+    @staticmethod
+    async def get_all_stations_async() -> List[Dict[str, Any]]:
+        """
+        Async get_all_stations(). The station query and the connectivity
+        index (which may need a line reload) are awaited concurrently.
+        
+        Returns:
+            List of station dictionaries
+        """
+        try:
+            query = """
+            SELECT S.id, S.name, S.alt_name, S.description, S.type, 
+                   S.status, S.platform_count, S.symbol, S.image_path
+            FROM station S
+            ORDER BY S.name
+            """
+            
+            stations, index = await asyncio.gather(
+                async_sql.execute_query(query),
+                LineController.get_derived_async('station_connectivity', StationController._build_connectivity_index)
+            )
+            index = index or {}
+            for station in stations:
+                connectivity = index.get(station['name'], {})
+                station['lines'] = [line['name'] for line in connectivity.get('lines', [])]
 
             return stations
         
@@ -172,6 +198,9 @@ class StationController:
             
             if not station_id:
                 logger.error(f"Failed to create station '{station_name}'")
+            else:
+                StationController.update_search_index(station_id, station_name)
+                StationController.mark_changed()
             
             return station_id
         
@@ -238,8 +267,24 @@ class StationController:
                         logger.warning(f"Invalid platform_count value: {update_data['platform_count']}, setting to None")
                         update_data['platform_count'] = None
             
+            # Lines list their stations by name
+            affected_lines = LineController.get_line_names_at_station(station['name'])
+            
             success = sql.update_by_id('station', station_id, update_data)
             
+            if success and 'name' in update_data:
+                LineController.invalidate_cache(updated=affected_lines)
+            
+            if success and ('name' in update_data or 'alt_name' in update_data):
+                StationController.update_search_index(
+                    station_id,
+                    update_data.get('name', station['name']),
+                    update_data.get('alt_name', station.get('alt_name'))
+                )
+            
+            if success:
+                StationController.mark_changed()
+            
             if not success:
                 # Check if the record still exists (maybe the update didn't change anything)
                 station_check = StationController.get_station_by_id(station_id)
@@ -278,18 +323,28 @@ class StationController:
                 logger.error(f"Station with ID {station_id} not found")
                 return False
             
-            # Check if station is used by any lines
-            line_count = sql.count('line_station', {'station_id': station_id})
-            if line_count > 0:
-                logger.warning(f"Station ID {station_id} is used by {line_count} line(s)")
-                # Delete line-station associations first
-                sql.delete('line_station', {'station_id': station_id})
+            affected_lines = LineController.get_line_names_at_station(station['name'])
             
-            # Delete the station
-            success = sql.delete_by_id('station', station_id)
+            with sql.transaction():
+                # Check if station is used by any lines
+                line_count = sql.count('line_station', {'station_id': station_id})
+                if line_count > 0:
+                    logger.warning(f"Station ID {station_id} is used by {line_count} line(s)")
+                    # Delete line-station associations first
+                    sql.delete('line_station', {'station_id': station_id})
+                
+                # Delete the station
+                success = sql.delete_by_id('station', station_id)
+                
+                if not success:
+                    logger.error(f"Failed to delete station ID {station_id}")
             
-            if not success:
-                logger.error(f"Failed to delete station ID {station_id}")
+            if line_count > 0:
+                LineController.invalidate_cache(updated=affected_lines)
+            
+            if success:
+                sql.on_commit(lambda: station_search_index.remove(station_id))
+                StationController.mark_changed()
             
             return success
         
@@ -340,6 +395,7 @@ class StationController:
                     {'station_order': order},
                     {'line_id': line['id'], 'station_id': station_id}
                 )
+                LineController.invalidate_cache(updated=[line_name])
                 return count > 0
             
             # Add station to line
@@ -350,6 +406,7 @@ class StationController:
             })
             
             if result:
+                LineController.invalidate_cache(updated=[line_name])
                 return True
             else:
                 logger.error(f"Failed to add station '{station_name}' to line '{line_name}'")
@@ -391,6 +448,7 @@ class StationController:
             })
             
             if count > 0:
+                LineController.invalidate_cache(updated=[line_name])
                 return True
             else:
                 logger.warning(f"Station '{station_name}' was not on line '{line_name}'")
@@ -419,18 +477,20 @@ class StationController:
                 logger.error(f"Line '{line_name}' not found")
                 return False
             
-            # Update each station's order
-            for order, station_name in enumerate(station_order):
-                station = StationController.get_station_by_name(station_name)
-                if not station:
-                    logger.warning(f"Station '{station_name}' not found, skipping")
-                    continue
-                
-                sql.update('line_station',
-                    {'station_order': order},
-                    {'line_id': line['id'], 'station_id': station['id']}
-                )
-            
+            with sql.transaction():
+                # Update each station's order
+                for order, station_name in enumerate(station_order):
+                    station = StationController.get_station_by_name(station_name)
+                    if not station:
+                        logger.warning(f"Station '{station_name}' not found, skipping")
+                        continue
+                    
+                    sql.update('line_station',
+                        {'station_order': order},
+                        {'line_id': line['id'], 'station_id': station['id']}
+                    )
+            
+            LineController.invalidate_cache(updated=[line_name])
             return True
         
         except Exception as e:
@@ -465,32 +525,149 @@ class StationController:
             return 0
     
     @staticmethod
-    def search_stations(search_term: str) -> List[Dict[str, Any]]:
+    def mark_changed():
         """
-        Search for stations by name (partial match).
+        Bump the station data version once the current transaction commits.
+        Must be called after every write to stations.
+        """
+        sql.on_commit(station_version.bump)
+    
+    @staticmethod
+    def get_stations_version() -> int:
+        """
+        Get the current version of the station data.
+        
+        Returns:
+            Version number, increased on every station change
+        """
+        return station_version.version
+    
+    @staticmethod
+    def search_stations(search_term: str, limit: int = 10) -> List[Dict[str, Any]]:
+        """
+        Search for stations by name or alternative name.
+        Served from the in-memory search index: prefix, substring and
+        typo tolerant (trigram) matches, best matches first.
         
         Args:
             search_term: Search term for station name
+            limit: Maximum number of results
         
         Returns:
-            List of matching station dictionaries
+            List of matching station dictionaries (id, name, alt_name)
         """
         try:
-            query = """
-            SELECT id, name
-            FROM station
-            WHERE name LIKE %s
-            ORDER BY name
-            """
-            
-            stations = sql.execute_query(query, (f"%{search_term}%",))
-            
-            return stations
+            return station_search_index.search(search_term, limit)
         
         except Exception as e:
             logger.error(f"Error searching stations: {str(e)}")
             return []
     
+    @staticmethod
+    def update_search_index(station_id: int, name: str, alt_name: Optional[str] = None):
+        """
+        Add or update a station in the search index once the current
+        transaction (if any) has been committed.
+        
+        Args:
+            station_id: ID of the station
+            name: Name of the station
+            alt_name: Alternative name of the station
+        """
+        document = {'id': station_id, 'name': name, 'alt_name': alt_name}
+        sql.on_commit(lambda: station_search_index.add(station_id, document, [name, alt_name]))
+    
+    @staticmethod
+    def _load_search_documents() -> Optional[List[tuple]]:
+        """
+        Load all stations for the search index.
+        
+        Returns:
+            List of (id, document, texts) tuples or None on failure
+        """
+        try:
+            # Run on the cursor directly so that a database error raises
+            # instead of caching an empty index
+            with sql.get_cursor() as cursor:
+                cursor.execute("SELECT id, name, alt_name FROM station")
+                rows = cursor.fetchall()
+            
+            return [
+                (row['id'], {'id': row['id'], 'name': row['name'], 'alt_name': row['alt_name']},
+                 [row['name'], row['alt_name']])
+                for row in rows
+            ]
+        
+        except Exception as e:
+            logger.error(f"Error loading station search index: {str(e)}")
+            return None
+    
+    @staticmethod
+    def get_station_connectivity(station_name: str) -> Optional[Dict[str, Any]]:
+        """
+        Get the lines, neighbouring stations and operators at a station
+        from the connectivity index.
+        
+        Args:
+            station_name: Name of the station
+        
+        Returns:
+            Dictionary with lines, connections, interchange, lines_by_type and
+            operators (shared, must not be modified), or None if no line
+            serves the station
+        """
+        index = LineController.get_derived('station_connectivity', StationController._build_connectivity_index)
+        return (index or {}).get(station_name)
+    
+    @staticmethod
+    def _build_connectivity_index(lines: List[Dict[str, Any]]) -> Dict[str, Dict[str, Any]]:
+        """
+        Build the connectivity of every station from the line snapshot.
+        Built once per line data version, so it follows every line change.
+        
+        Returns:
+            Dictionary of station name -> connectivity
+        """
+        index = {}
+        
+        def entry(name):
+            if name not in index:
+                index[name] = {'lines': [], 'connections': {}, 'lines_by_type': {}, 'operators': {}}
+            return index[name]
+        
+        for line in lines:
+            stations = line['stations']
+            line_info = {
+                'name': line['name'],
+                'color': line['color'],
+                'status': line['status'],
+                'type': line['type'],
+                'operator_name': line['operator'] or None,
+                'operator_uid': line['operator_uid'] or None
+            }
+            
+            for position, name in enumerate(stations):
+                station = entry(name)
+                station['lines'].append(line_info)
+                station['lines_by_type'][line['type']] = station['lines_by_type'].get(line['type'], 0) + 1
+                if line['operator']:
+                    station['operators'][line['operator']] = station['operators'].get(line['operator'], 0) + 1
+                
+                # Neighbours are the stations before and after on the line
+                for neighbour in stations[max(position - 1, 0):position] + stations[position + 1:position + 2]:
+                    if neighbour != name:
+                        station['connections'].setdefault(neighbour, []).append(line['name'])
+        
+        for station in index.values():
+            station['lines'].sort(key=lambda line: line['name'])
+            station['connections'] = [
+                {'station': name, 'lines': sorted(set(line_names))}
+                for name, line_names in sorted(station['connections'].items())
+            ]
+            station['interchange'] = len(station['lines']) > 1
+        
+        return index
+    
     @staticmethod
     def get_station_statistics(station_name: str) -> Dict[str, Any]:
         """
@@ -502,35 +679,69 @@ class StationController:
         Returns:
             Dictionary with station statistics
         """
+        details = StationController.get_station_details(station_name, allow_id=False)
+        if not details:
+            logger.error(f"Station '{station_name}' not found")
+            return {}
+        
+        return details['statistics']
+    
+    @staticmethod
+    def get_station_details(id_or_name: str, allow_id: bool = True) -> Optional[Dict[str, Any]]:
+        """
+        Get a station with the lines serving it, its neighbouring stations
+        and its statistics.
+        OPTIMIZED: Uses one query for the station, lines come from the connectivity index
+        
+        Args:
+            id_or_name: Name of the station, or its ID if numeric
+            allow_id: Treat numeric values as ID
+        
+        Returns:
+            Dictionary with station, lines, connections and statistics or None if not found
+        """
         try:
-            station = StationController.get_station_by_name(station_name)
+            if allow_id and str(id_or_name).isdigit():
+                station = sql.select_by_id('station', int(id_or_name))
+            else:
+                station = sql.select_one('station', where={'name': id_or_name})
             if not station:
-                logger.error(f"Station '{station_name}' not found")
-                return {}
-            
-            lines = StationController.get_lines_at_station(station_name)
-            
-            # Count lines by type
-            line_types = {}
-            for line in lines:
-                line_type = line.get('type', 'public')
-                line_types[line_type] = line_types.get(line_type, 0) + 1
-            
-            # Count operators
-            operators = set(line.get('operator_name') for line in lines if line.get('operator_name'))
-            
-            stats = {
-                'station_name': station_name,
-                'station_id': station['id'],
-                'total_lines': len(lines),
-                'lines_by_type': line_types,
-                'operators_count': len(operators),
-                'operators': list(operators),
-                'lines': [{'name': line['name'], 'color': line.get('color')} for line in lines]
-            }
+                return None
+            
+            connectivity = StationController.get_station_connectivity(station['name']) or {}
+            lines = [dict(line) for line in connectivity.get('lines', [])]
             
-            return stats
+            return {
+                'station': station,
+                'lines': lines,
+                'connections': [dict(connection) for connection in connectivity.get('connections', [])],
+                'statistics': StationController._build_statistics(station, connectivity)
+            }
         
         except Exception as e:
-            logger.error(f"Error generating statistics for station '{station_name}': {str(e)}")
-            return {}
+            logger.error(f"Error fetching details for station '{id_or_name}': {str(e)}")
+            return None
+    
+    @staticmethod
+    def _build_statistics(station: Dict[str, Any], connectivity: Dict[str, Any]) -> Dict[str, Any]:
+        """Build the statistics of a station from its connectivity."""
+        lines = connectivity.get('lines', [])
+        operators = connectivity.get('operators', {})
+        
+        return {
+            'station_name': station['name'],
+            'station_id': station['id'],
+            'total_lines': len(lines),
+            'lines_by_type': dict(connectivity.get('lines_by_type', {})),
+            'operators_count': len(operators),
+            'operators': list(operators),
+            'lines_per_operator': dict(operators),
+            'interchange': connectivity.get('interchange', False),
+            'connections_count': len(connectivity.get('connections', [])),
+            'lines': [{'name': line['name'], 'color': line.get('color')} for line in lines]
+        }
+
+station_version = DataVersion("stations")
+# Reloaded when another worker process changed stations
+station_search_index = SearchIndex("stations", StationController._load_search_documents,
+                                   lambda: station_version.external_changes)
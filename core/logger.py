@@ -1,34 +1,329 @@
 from core import main_dir
+from core.config import config
 
+import atexit
+import copy
+import json
 import logging
-from logging.handlers import RotatingFileHandler
+from logging.handlers import QueueHandler, QueueListener, RotatingFileHandler
 import os
+import queue
+import sqlite3
+import threading
+import time
+
+try:
+    import fcntl
+except ImportError:
+    # Windows, only needed with several worker processes
+    fcntl = None
+
+LOG_FILE = os.path.join(main_dir, "server.log")
+LOG_MAX_BYTES = 1024*1024
+# Rotated files are LOG_FILE.1 (newest) to LOG_FILE.<LOG_BACKUP_COUNT> (oldest)
+LOG_BACKUP_COUNT = 5
+LOG_FORMAT = '%(asctime)s - %(name)s - [%(levelname)s] - %(message)s'
+LOG_DATE_FORMAT = '%Y-%m-%d %H:%M:%S+UTC0'
+
+# SQLite index of log records, see _LogIndexHandler
+LOG_INDEX_FILE = os.path.join(main_dir, "server_log.sqlite3")
+LOG_INDEX_RETENTION = 60 * 60 * 24 * 30
+
+ADMIN_LEVEL = 25
+
+# Records waiting for the writer thread. When it is full, records below
+# ADMIN are dropped; admin audit records and above wait up to
+# LOG_QUEUE_BLOCK_TIMEOUT.
+LOG_QUEUE_SIZE = 10000
+LOG_QUEUE_BLOCK_TIMEOUT = 1.0
+
+
+def _request_context():
+    """(user id, username, route) of the current Flask request, if any."""
+    try:
+        from flask import has_request_context, request, session
+    except ImportError:
+        return None, None, None
+
+    if not has_request_context():
+        return None, None, None
+
+    user = session.get('user') or {}
+    return user.get('id'), user.get('username'), request.path
+
+
+class _JsonFormatter(logging.Formatter):
+    """Formats a record as one JSON object per line."""
+
+    def format(self, record):
+        data = {
+            'timestamp': self.formatTime(record, LOG_DATE_FORMAT),
+            'level': record.levelname,
+            'logger': record.name,
+            'message': record.getMessage()
+        }
+        for field in ('user_id', 'username', 'route'):
+            if getattr(record, field, None):
+                data[field] = getattr(record, field)
+        if record.exc_text:
+            data['exception'] = record.exc_text
+        return json.dumps(data, ensure_ascii=False)
+
+
+class _SharedRotatingFileHandler(RotatingFileHandler):
+    """
+    RotatingFileHandler that can be used by several worker processes at
+    once. Writes and rollovers are serialized with a lock file, and a
+    process whose file was rotated by another one reopens the new file.
+    """
+
+    def __init__(self, filename, **kwargs):
+        super().__init__(filename, **kwargs)
+        self._lock_path = filename + '.lock'
+
+    def emit(self, record):
+        if fcntl is None:
+            return super().emit(record)
+
+        try:
+            with open(self._lock_path, 'a') as lock:
+                fcntl.flock(lock, fcntl.LOCK_EX)
+                try:
+                    self._reopen_if_rotated()
+                    super().emit(record)
+                finally:
+                    fcntl.flock(lock, fcntl.LOCK_UN)
+        except Exception:
+            self.handleError(record)
+
+    def _reopen_if_rotated(self):
+        if self.stream is None:
+            return
+        try:
+            rotated = os.stat(self.baseFilename).st_ino != os.fstat(self.stream.fileno()).st_ino
+        except OSError:
+            rotated = True
+        if rotated:
+            self.stream.close()
+            self.stream = self._open()
+
+
+class _LogIndexHandler(logging.Handler):
+    """
+    Appends records to a SQLite database indexed by time, level, logger
+    and user, so admin log searches don't have to scan the log files.
+    Only used from the writer thread; records older than
+    LOG_INDEX_RETENTION are removed now and then.
+    """
+
+    def __init__(self, path):
+        super().__init__()
+        self.path = path
+        self._connection = None
+        self._inserts = 0
+
+    def _connect(self):
+        # Written by the writer thread only, but closed by logging.shutdown().
+        # Worker processes share the database, wait for each other's writes.
+        connection = sqlite3.connect(self.path, timeout=10, check_same_thread=False)
+        connection.execute("PRAGMA journal_mode=WAL")
+        connection.execute("PRAGMA synchronous=NORMAL")
+        connection.executescript("""
+            CREATE TABLE IF NOT EXISTS log (
+                id INTEGER PRIMARY KEY,
+                created REAL NOT NULL,
+                level TEXT NOT NULL,
+                logger TEXT NOT NULL,
+                user_id TEXT,
+                username TEXT,
+                route TEXT,
+                message TEXT NOT NULL
+            );
+            CREATE INDEX IF NOT EXISTS log_created ON log (created);
+            CREATE INDEX IF NOT EXISTS log_level ON log (level, created);
+            CREATE INDEX IF NOT EXISTS log_logger ON log (logger, created);
+            CREATE INDEX IF NOT EXISTS log_user ON log (user_id, created);
+            CREATE INDEX IF NOT EXISTS log_username ON log (username, created);
+        """)
+        return connection
+
+    def emit(self, record):
+        try:
+            if self._connection is None:
+                self._connection = self._connect()
+
+            message = record.getMessage()
+            if record.exc_text:
+                message += '\n' + record.exc_text
+
+            self._connection.execute(
+                "INSERT INTO log (created, level, logger, user_id, username, route, message) "
+                "VALUES (?, ?, ?, ?, ?, ?, ?)",
+                (record.created, record.levelname, record.name, getattr(record, 'user_id', None),
+                 getattr(record, 'username', None), getattr(record, 'route', None), message)
+            )
+            self._inserts += 1
+            if self._inserts % 1000 == 0:
+                self._connection.execute("DELETE FROM log WHERE created < ?",
+                                         (time.time() - LOG_INDEX_RETENTION,))
+            self._connection.commit()
+        except Exception:
+            self.handleError(record)
+
+    def close(self):
+        if self._connection is not None:
+            self._connection.close()
+            self._connection = None
+        super().close()
+
+    def reset_after_fork(self):
+        """Forget the parent's connection, SQLite connections must not cross a fork."""
+        self._connection = None
+
+
+class _LogQueueHandler(QueueHandler):
+    """
+    Hands records to the writer thread. Formatting and I/O happen there.
+    Applies the drop/backpressure policy when the queue is full and
+    reports the number of dropped records once there is room again.
+    """
+
+    def __init__(self, log_queue):
+        super().__init__(log_queue)
+        self.dropped = 0
+        self._dropped_lock = threading.Lock()
+
+    def prepare(self, record):
+        # Only resolve what can't cross threads: the message arguments and
+        # the traceback. Everything else is formatted by the writer thread.
+        record = copy.copy(record)
+        record.msg = record.getMessage()
+        record.args = None
+        if config.log_format == 'json' or config.log_index:
+            record.user_id, record.username, record.route = _request_context()
+        if record.exc_info:
+            record.exc_text = logging.Formatter().formatException(record.exc_info)
+            record.exc_info = None
+        return record
+
+    def enqueue(self, record):
+        if self.dropped:
+            self._report_dropped()
+
+        try:
+            self.queue.put_nowait(record)
+            return
+        except queue.Full:
+            pass
+
+        # Admin records are the audit trail, they are never dropped first
+        if record.levelno >= ADMIN_LEVEL:
+            try:
+                self.queue.put(record, timeout=LOG_QUEUE_BLOCK_TIMEOUT)
+                return
+            except queue.Full:
+                pass
+
+        with self._dropped_lock:
+            self.dropped += 1
+
+    def _report_dropped(self):
+        with self._dropped_lock:
+            dropped, self.dropped = self.dropped, 0
+        if not dropped:
+            return
+
+        record = logging.LogRecord("@logger", logging.WARNING, __file__, 0,
+                                   f"Log queue full, dropped {dropped} records", None, None)
+        try:
+            self.queue.put_nowait(record)
+        except queue.Full:
+            with self._dropped_lock:
+                self.dropped += dropped
+
+
+_queue_handler = None
+_listener = None
+_setup_lock = threading.Lock()
+
+
+def _stop_listener():
+    """Stop the writer thread after it has written all queued records."""
+    if _listener is not None and _listener._thread is not None:
+        _listener.stop()
+
+
+def _get_queue_handler():
+    """Create the shared handlers and start the writer thread, once per process."""
+    global _queue_handler, _listener
+
+    with _setup_lock:
+        if _queue_handler is None:
+            formatter = logging.Formatter(LOG_FORMAT, datefmt=LOG_DATE_FORMAT)
+
+            file_handler = _SharedRotatingFileHandler(LOG_FILE, maxBytes=LOG_MAX_BYTES, backupCount=LOG_BACKUP_COUNT)
+            file_handler.setFormatter(_JsonFormatter() if config.log_format == 'json' else formatter)
+
+            console_handler = logging.StreamHandler()
+            console_handler.setFormatter(formatter)
+
+            handlers = [file_handler, console_handler]
+            if config.log_index:
+                handlers.append(_LogIndexHandler(LOG_INDEX_FILE))
+
+            log_queue = queue.Queue(maxsize=LOG_QUEUE_SIZE)
+            _listener = QueueListener(log_queue, *handlers)
+            _listener.start()
+            # Write out what is still queued when the process exits
+            atexit.register(_stop_listener)
+
+            _queue_handler = _LogQueueHandler(log_queue)
+
+    return _queue_handler
+
+
+def _restart_after_fork():
+    """
+    Give a forked worker process its own queue and writer thread; threads
+    don't survive a fork, and records queued in the parent are its own.
+    """
+    global _listener
+
+    if _listener is None:
+        return
+
+    for handler in _listener.handlers:
+        if isinstance(handler, _LogIndexHandler):
+            handler.reset_after_fork()
+
+    log_queue = queue.Queue(maxsize=LOG_QUEUE_SIZE)
+    _queue_handler.queue = log_queue
+    _queue_handler.dropped = 0
+    _queue_handler._dropped_lock = threading.Lock()
+    _listener = QueueListener(log_queue, *_listener.handlers)
+    _listener.start()
+
+
+if hasattr(os, 'register_at_fork'):
+    os.register_at_fork(after_in_child=_restart_after_fork)
 
 
 class Logger:
     def __init__(self, name):
-        ADMIN_LEVEL = 25 
         logging.addLevelName(ADMIN_LEVEL, "ADMIN")
 
         self.name = name
         self.logger = logging.getLogger(name)
         self.logger.setLevel(logging.DEBUG)
 
-        log_file = os.path.join(main_dir, "server.log")
-
-        file_handler = RotatingFileHandler(log_file, maxBytes=1024*1024, backupCount=5)
-        file_handler.setFormatter(logging.Formatter('%(asctime)s - %(name)s - [%(levelname)s] - %(message)s', 
-                                                  datefmt='%Y-%m-%d %H:%M:%S+UTC0'))
-        self.logger.addHandler(file_handler)
-
-        console_handler = logging.StreamHandler()
-        console_handler.setFormatter(logging.Formatter('%(asctime)s - %(name)s - [%(levelname)s] - %(message)s',
-                                                     datefmt='%Y-%m-%d %H:%M:%S+UTC0'))
-        self.logger.addHandler(console_handler)
+        # Loggers with the same name are shared, add the handler only once
+        queue_handler = _get_queue_handler()
+        if queue_handler not in self.logger.handlers:
+            self.logger.addHandler(queue_handler)
 
         def admin(self, message):
             self.log(ADMIN_LEVEL, message)
-            
+
         logging.Logger.admin = admin
 
     def debug(self, message):
@@ -50,4 +345,4 @@ class Logger:
         self.logger.critical(message)
 
 
-logger = Logger("@main")
\ No newline at end of file
+logger = Logger("@main")
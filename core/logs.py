@@ -0,0 +1,340 @@
+from typing import Any, Dict, Iterator, List, Optional, Tuple
+from core.logger import LOG_FILE, LOG_BACKUP_COUNT, LOG_DATE_FORMAT, LOG_INDEX_FILE
+
+import json
+import os
+import sqlite3
+import time
+
+# Bytes read per seek when reading a log file backwards
+CHUNK_SIZE = 64 * 1024
+# Hard limit of entries returned by one call
+MAX_LIMIT = 1000
+
+
+"""
+    --- Log reader ---
+    Reads the rotating log set (server.log, server.log.1 ... server.log.5)
+    with seeks instead of loading whole files, so memory use only depends
+    on the number of requested entries.
+
+    Positions are handed out as cursors "<inode>:<offset>". The inode
+    identifies a file across rotations (server.log becomes server.log.1
+    but keeps its inode), so a cursor stays valid while the file is
+    within the rotating set.
+"""
+
+
+def _log_files() -> List[str]:
+    """Paths of the log set, newest first."""
+    return [LOG_FILE] + [f"{LOG_FILE}.{index}" for index in range(1, LOG_BACKUP_COUNT + 1)]
+
+
+def _existing_log_files() -> List[Tuple[str, int]]:
+    """(path, inode) of the existing log files, newest first."""
+    files = []
+    for path in _log_files():
+        try:
+            files.append((path, os.stat(path).st_ino))
+        except OSError:
+            continue
+    return files
+
+
+def _make_cursor(inode: int, offset: int) -> str:
+    return f"{inode}:{offset}"
+
+
+def _parse_cursor(cursor: str) -> Optional[Tuple[int, int]]:
+    try:
+        inode, offset = cursor.split(':', 1)
+        return int(inode), int(offset)
+    except (AttributeError, ValueError):
+        return None
+
+
+def parse_log_line(line: str) -> Dict[str, str]:
+    """
+    Split a log line (text or JSON format) into its parts.
+    Lines that don't match the log format (e.g. traceback lines) only have
+    a message.
+
+    Returns:
+        dict with timestamp, logger, level and message
+    """
+    if line.startswith('{'):
+        try:
+            data = json.loads(line)
+            message = data.get('message', '')
+            if data.get('exception'):
+                message += '\n' + data['exception']
+            return {
+                'timestamp': data.get('timestamp', ''),
+                'logger': data.get('logger', ''),
+                'level': data.get('level', ''),
+                'message': message
+            }
+        except (ValueError, AttributeError):
+            pass
+
+    parts = line.split(' - ', 3)
+    if len(parts) == 4 and parts[2].startswith('[') and parts[2].endswith(']'):
+        return {
+            'timestamp': parts[0],
+            'logger': parts[1],
+            'level': parts[2][1:-1],
+            'message': parts[3]
+        }
+    return {'timestamp': '', 'logger': '', 'level': '', 'message': line}
+
+
+def _matches(entry: Dict[str, str], line: str, level: Optional[str],
+             logger_name: Optional[str], text: Optional[str]) -> bool:
+    if level and entry['level'] != level:
+        return False
+    if logger_name and entry['logger'] != logger_name:
+        return False
+    if text and text not in line.lower():
+        return False
+    return True
+
+
+def _reverse_lines(f, end: int) -> Iterator[Tuple[int, bytes]]:
+    """Yield (offset, line) of a file from the given end position backwards."""
+    pos = end
+    rest = b''
+
+    while pos > 0:
+        size = min(CHUNK_SIZE, pos)
+        pos -= size
+        f.seek(pos)
+        parts = (f.read(size) + rest).split(b'\n')
+
+        # The first part may continue in the previous chunk
+        rest = parts[0]
+        offset = pos + len(rest) + 1
+        lines = []
+        for part in parts[1:]:
+            lines.append((offset, part))
+            offset += len(part) + 1
+
+        yield from reversed(lines)
+
+    if rest:
+        yield 0, rest
+
+
+def _complete_end(f, size: int) -> int:
+    """Position after the last complete line, a line being written is left out."""
+    pos = size
+    while pos > 0:
+        chunk_start = max(0, pos - CHUNK_SIZE)
+        f.seek(chunk_start)
+        newline = f.read(pos - chunk_start).rfind(b'\n')
+        if newline != -1:
+            return chunk_start + newline + 1
+        pos = chunk_start
+    return 0
+
+
+def read_logs(before: Optional[str] = None, limit: int = 200, level: Optional[str] = None,
+              logger_name: Optional[str] = None, text: Optional[str] = None) -> Dict[str, Any]:
+    """
+    Read log entries newest first, across the rotated files.
+
+    Args:
+        before: Cursor to continue from (next_cursor of the previous page)
+        limit: Maximum number of entries
+        level: Only entries of this level (e.g. 'ERROR')
+        logger_name: Only entries of this logger (e.g. '@sql')
+        text: Only entries containing this text (case-insensitive)
+
+    Returns:
+        dict with
+            entries: parsed entries, newest first, each with its cursor
+            next_cursor: cursor for the next (older) page or None at the start of the log
+            cursor: position after the newest entry, for read_logs_after()
+                (only on the first page)
+    """
+    limit = max(1, min(int(limit), MAX_LIMIT))
+    text = text.lower() if text else None
+    files = _existing_log_files()
+
+    start_index, start_offset = 0, None
+    if before:
+        position = _parse_cursor(before)
+        inodes = [inode for _, inode in files]
+        if position is None or position[0] not in inodes:
+            return {'entries': [], 'next_cursor': None}
+        start_index, start_offset = inodes.index(position[0]), position[1]
+
+    result = {'entries': [], 'next_cursor': None}
+    if before is None:
+        result['cursor'] = _make_cursor(files[0][1], 0) if files else None
+
+    entries = result['entries']
+    for index in range(start_index, len(files)):
+        path, inode = files[index]
+        try:
+            with open(path, 'rb') as f:
+                end = os.fstat(f.fileno()).st_size
+                if index == start_index and start_offset is not None:
+                    end = min(start_offset, end)
+                elif index == 0:
+                    end = _complete_end(f, end)
+                    result['cursor'] = _make_cursor(inode, end)
+
+                for offset, raw in _reverse_lines(f, end):
+                    line = raw.decode('utf-8', errors='replace').strip()
+                    if not line:
+                        continue
+
+                    if len(entries) == limit:
+                        result['next_cursor'] = _make_cursor(inode, offset + len(raw) + 1)
+                        return result
+
+                    entry = parse_log_line(line)
+                    if _matches(entry, line, level, logger_name, text):
+                        entry['cursor'] = _make_cursor(inode, offset)
+                        entries.append(entry)
+        except OSError:
+            continue
+
+    return result
+
+
+def read_logs_after(cursor: str, limit: int = 500) -> Dict[str, Any]:
+    """
+    Read the log entries written after a cursor, oldest first.
+    Follows the file over a rotation; only complete lines are returned.
+
+    Args:
+        cursor: Cursor returned by read_logs() or a previous call
+        limit: Maximum number of entries
+
+    Returns:
+        dict with
+            entries: parsed entries, oldest first
+            cursor: cursor to continue from
+            reset: True if the cursor is no longer in the log set
+                (the client should reload with read_logs())
+    """
+    limit = max(1, min(int(limit), MAX_LIMIT))
+    files = _existing_log_files()
+    position = _parse_cursor(cursor)
+    inodes = [inode for _, inode in files]
+
+    if position is None or position[0] not in inodes:
+        return {'entries': [], 'cursor': None, 'reset': True}
+
+    index, offset = inodes.index(position[0]), position[1]
+    entries = []
+
+    # From the cursor's file forward to the current log file
+    while True:
+        path, inode = files[index]
+        try:
+            with open(path, 'rb') as f:
+                if offset > os.fstat(f.fileno()).st_size:
+                    return {'entries': [], 'cursor': None, 'reset': True}
+
+                f.seek(offset)
+                while len(entries) < limit:
+                    raw = f.readline()
+                    if not raw.endswith(b'\n'):
+                        break
+                    offset += len(raw)
+
+                    line = raw.decode('utf-8', errors='replace').strip()
+                    if line:
+                        entries.append(parse_log_line(line))
+        except OSError:
+            return {'entries': entries, 'cursor': None, 'reset': True}
+
+        if index == 0 or len(entries) == limit:
+            return {'entries': entries, 'cursor': _make_cursor(inode, offset), 'reset': False}
+
+        index, offset = index - 1, 0
+
+
+def search_log_index(before: Optional[int] = None, limit: int = 200, level: Optional[str] = None,
+                     logger_name: Optional[str] = None, user: Optional[str] = None,
+                     text: Optional[str] = None, since: Optional[float] = None,
+                     until: Optional[float] = None) -> Dict[str, Any]:
+    """
+    Search the SQLite log index (logging.index in config.yml), newest first.
+    Level, logger, user and time filters are answered from indexes.
+
+    Args:
+        before: Only entries with a smaller id (next_cursor of the previous page)
+        limit: Maximum number of entries
+        level: Only entries of this level (e.g. 'ADMIN')
+        logger_name: Only entries of this logger (e.g. '@sql')
+        user: Only entries of requests by this user (Discord ID or username)
+        text: Only entries containing this text (case-insensitive)
+        since: Only entries logged at or after this unix timestamp
+        until: Only entries logged before this unix timestamp
+
+    Returns:
+        dict with entries (newest first) and next_cursor (None on the last page)
+
+    Example:
+        # All ADMIN events by a user in the last day
+        search_log_index(level='ADMIN', user='123456789', since=time.time() - 86400)
+    """
+    limit = max(1, min(int(limit), MAX_LIMIT))
+    conditions = []
+    params = []
+
+    if before is not None:
+        conditions.append("id < ?")
+        params.append(int(before))
+    if level:
+        conditions.append("level = ?")
+        params.append(level)
+    if logger_name:
+        conditions.append("logger = ?")
+        params.append(logger_name)
+    if user:
+        conditions.append("(user_id = ? OR username = ?)")
+        params.extend([user, user])
+    if text:
+        conditions.append("message LIKE ?")
+        params.append(f"%{text}%")
+    if since is not None:
+        conditions.append("created >= ?")
+        params.append(since)
+    if until is not None:
+        conditions.append("created < ?")
+        params.append(until)
+
+    query = "SELECT id, created, level, logger, user_id, username, route, message FROM log"
+    if conditions:
+        query += " WHERE " + " AND ".join(conditions)
+    query += " ORDER BY id DESC LIMIT ?"
+    params.append(limit + 1)
+
+    if not os.path.exists(LOG_INDEX_FILE):
+        return {'entries': [], 'next_cursor': None}
+
+    connection = sqlite3.connect(f"file:{LOG_INDEX_FILE}?mode=ro", uri=True)
+    try:
+        rows = connection.execute(query, params).fetchall()
+    finally:
+        connection.close()
+
+    entries = [{
+        'timestamp': time.strftime(LOG_DATE_FORMAT, time.localtime(created)),
+        'logger': logger,
+        'level': level,
+        'message': message,
+        'user_id': user_id,
+        'username': username,
+        'route': route,
+        'cursor': str(entry_id)
+    } for entry_id, created, level, logger, user_id, username, route, message in rows[:limit]]
+
+    return {
+        'entries': entries,
+        'next_cursor': entries[-1]['cursor'] if len(rows) > limit else None
+    }
@@ -0,0 +1,289 @@
+from typing import Any, Dict, List, Optional
+from core.sql import sql
+from core.logger import Logger
+from core.controller.line import line_cache
+
+import heapq
+import threading
+
+logger = Logger("@network")
+
+# Cost of riding from one station to the next
+STOP_COST = 1
+# Extra cost of changing lines, in stops
+TRANSFER_PENALTY = 5
+# Lines with this status are not used for routing
+SUSPENDED_STATUS = 'suspended'
+
+
+class RailwayNetwork:
+    """
+    In-memory graph of the railway network built from line, line_station
+    and station: adjacency lists keyed by station id and the set of lines
+    serving each station. Stations that are on no line are not part of it.
+
+    The graph follows the line data version. The first use loads the whole
+    network; later versions only reload the lines named in the line change
+    log, unless the log can't tell what changed.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._version = None
+        # line name -> {'color', 'status', 'stations': [station ids in order]}
+        self._lines = {}
+        # station id -> {neighbour station id -> set of line names}
+        self._adjacency = {}
+        # station id -> set of line names serving it
+        self._station_lines = {}
+        self._station_names = {}
+        self._station_ids = {}
+
+    # ==================== Loading ====================
+
+    def _ensure_current(self) -> bool:
+        """Bring the graph up to the current line data version."""
+        if self._version == line_cache.version:
+            return True
+
+        with self._lock:
+            if self._version is None:
+                return self._reload()
+
+            current, changes = line_cache.changes_since(self._version)
+            if current == self._version:
+                return True
+            if changes is None:
+                return self._reload()
+
+            try:
+                for name in changes:
+                    self._remove_line(name)
+                changed = [name for name, action in changes.items() if action != 'deleted']
+                if changed:
+                    self._load_lines(changed)
+            except Exception as e:
+                logger.error(f"Error updating railway network: {str(e)}")
+                # Start over on the next use
+                self._version = None
+                return False
+
+            self._version = current
+            return True
+
+    def _reload(self) -> bool:
+        """Load the whole network. Must be called with the lock held."""
+        version = line_cache.version
+        self._lines = {}
+        self._adjacency = {}
+        self._station_lines = {}
+        self._station_names = {}
+        self._station_ids = {}
+
+        try:
+            self._load_lines(None)
+        except Exception as e:
+            logger.error(f"Error loading railway network: {str(e)}")
+            self._version = None
+            return False
+
+        self._version = version
+        logger.debug(f"Loaded railway network ({len(self._lines)} lines, {len(self._station_lines)} stations)")
+        return True
+
+    def _load_lines(self, names: Optional[List[str]]):
+        """Load lines (all if names is None) with their stations into the graph."""
+        query = """
+        SELECT l.name as line_name, l.color, l.status, ls.station_id, s.name as station_name
+        FROM line l
+        LEFT JOIN line_station ls ON l.id = ls.line_id
+        LEFT JOIN station s ON ls.station_id = s.id
+        """
+        params = ()
+        if names is not None:
+            query += f" WHERE l.name IN ({', '.join(['%s'] * len(names))})"
+            params = tuple(names)
+        query += " ORDER BY l.id, ls.station_order"
+
+        with sql.get_cursor() as cursor:
+            cursor.execute(query, params)
+            rows = cursor.fetchall()
+
+        lines = {}
+        station_names = {}
+        for row in rows:
+            line = lines.setdefault(row['line_name'], {
+                'color': row['color'],
+                'status': row['status'] or 'Running',
+                'stations': []
+            })
+            if row['station_id'] is not None:
+                line['stations'].append(row['station_id'])
+                station_names[row['station_id']] = row['station_name']
+
+        for name, line in lines.items():
+            self._add_line(name, line)
+        # After adding, replacing a line may forget stations it served alone
+        for station_id, station_name in station_names.items():
+            self._set_station_name(station_id, station_name)
+
+    def _set_station_name(self, station_id: int, name: str):
+        old_name = self._station_names.get(station_id)
+        if old_name is not None and old_name != name:
+            self._station_ids.pop(old_name.casefold(), None)
+        self._station_names[station_id] = name
+        self._station_ids[name.casefold()] = station_id
+
+    def _forget_station(self, station_id: int):
+        """Drop the name of a station no line serves any more, so it isn't found."""
+        name = self._station_names.pop(station_id, None)
+        if name is not None and self._station_ids.get(name.casefold()) == station_id:
+            del self._station_ids[name.casefold()]
+
+    def _add_line(self, name: str, line: Dict[str, Any]):
+        self._remove_line(name)
+        self._lines[name] = line
+
+        stations = line['stations']
+        for station_id in stations:
+            self._station_lines.setdefault(station_id, set()).add(name)
+
+        if line['status'].casefold() == SUSPENDED_STATUS:
+            return
+
+        for a, b in zip(stations, stations[1:]):
+            if a == b:
+                continue
+            self._adjacency.setdefault(a, {}).setdefault(b, set()).add(name)
+            self._adjacency.setdefault(b, {}).setdefault(a, set()).add(name)
+
+    def _remove_line(self, name: str):
+        line = self._lines.pop(name, None)
+        if line is None:
+            return
+
+        stations = line['stations']
+        for station_id in stations:
+            serving = self._station_lines.get(station_id)
+            if serving is not None:
+                serving.discard(name)
+                if not serving:
+                    del self._station_lines[station_id]
+                    self._forget_station(station_id)
+
+        for a, b in zip(stations, stations[1:]):
+            for x, y in ((a, b), (b, a)):
+                edge = self._adjacency.get(x, {}).get(y)
+                if edge is None:
+                    continue
+                edge.discard(name)
+                if not edge:
+                    del self._adjacency[x][y]
+                    if not self._adjacency[x]:
+                        del self._adjacency[x]
+
+    # ==================== Queries ====================
+
+    def find_station(self, id_or_name: str) -> Optional[int]:
+        """
+        Resolve a station id (numeric) or name (case-insensitive) to its id.
+
+        Returns:
+            Station ID or None if the station isn't on any line
+        """
+        if not self._ensure_current():
+            return None
+
+        id_or_name = str(id_or_name).strip()
+        if id_or_name.isdigit() and int(id_or_name) in self._station_names:
+            return int(id_or_name)
+        return self._station_ids.get(id_or_name.casefold())
+
+    def find_route(self, from_station: int, to_station: int) -> Optional[Dict[str, Any]]:
+        """
+        Find the cheapest route between two stations.
+        Every stop costs STOP_COST, every change of line TRANSFER_PENALTY.
+        Suspended lines are not used.
+
+        Args:
+            from_station: ID of the start station
+            to_station: ID of the destination station
+
+        Returns:
+            Dictionary with the route's legs, number of stops and transfers,
+            or None if the destination can't be reached
+        """
+        if not self._ensure_current():
+            return None
+
+        with self._lock:
+            if from_station == to_station:
+                return self._build_route([from_station], [])
+
+            # Dijkstra over (station, line) states, so changing lines can cost extra
+            start = (from_station, None)
+            costs = {start: 0}
+            previous = {}
+            queue = [(0, 0, from_station, None)]
+            counter = 0
+
+            while queue:
+                cost, _, station, line = heapq.heappop(queue)
+                if station == to_station:
+                    return self._build_route(*self._walk_back(previous, (station, line)))
+                if cost > costs.get((station, line), cost):
+                    continue
+
+                for neighbour, lines in self._adjacency.get(station, {}).items():
+                    for next_line in lines:
+                        next_cost = cost + STOP_COST
+                        if line is not None and next_line != line:
+                            next_cost += TRANSFER_PENALTY
+
+                        state = (neighbour, next_line)
+                        if next_cost < costs.get(state, float('inf')):
+                            costs[state] = next_cost
+                            previous[state] = (station, line)
+                            counter += 1
+                            heapq.heappush(queue, (next_cost, counter, neighbour, next_line))
+
+            return None
+
+    @staticmethod
+    def _walk_back(previous, state):
+        stations = []
+        lines = []
+        while state in previous:
+            stations.append(state[0])
+            lines.append(state[1])
+            state = previous[state]
+        stations.append(state[0])
+        return stations[::-1], lines[::-1]
+
+    def _build_route(self, stations: List[int], lines: List[str]) -> Dict[str, Any]:
+        """Group a path of stations and the line used for each hop into legs."""
+        legs = []
+        for index, line in enumerate(lines):
+            if not legs or legs[-1]['line'] != line:
+                legs.append({
+                    'line': line,
+                    'color': self._lines[line]['color'],
+                    'stations': [self._station_names[stations[index]]]
+                })
+            legs[-1]['stations'].append(self._station_names[stations[index + 1]])
+
+        for leg in legs:
+            leg['from'] = leg['stations'][0]
+            leg['to'] = leg['stations'][-1]
+            leg['stops'] = len(leg['stations']) - 1
+
+        return {
+            'from': self._station_names[stations[0]],
+            'to': self._station_names[stations[-1]],
+            'stops': len(stations) - 1,
+            'transfers': max(len(legs) - 1, 0),
+            'legs': legs
+        }
+
+
+railway_network = RailwayNetwork()
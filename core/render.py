@@ -0,0 +1,100 @@
+from typing import Any, Callable, Dict
+from flask import render_template, session
+from markupsafe import Markup
+from core.cache import TTLCache
+
+# Rendered pages kept in memory. The data version is part of the key, the
+# ttl only bounds how long data from outside the database (e.g. Discord
+# user names) can be shown.
+PAGE_CACHE_SIZE = 128
+PAGE_CACHE_TTL = 300
+
+ANONYMOUS = 'anonymous'
+USER = 'user'
+MEMBER = 'member'
+ADMIN = 'admin'
+
+# Stands in for the navbar in pages cached for signed in viewers
+NAVBAR_PLACEHOLDER = Markup('<!-- navbar -->')
+
+page_cache = TTLCache("pages", PAGE_CACHE_SIZE, PAGE_CACHE_TTL)
+
+
+def viewer_role(admin: bool = False, member: bool = False) -> str:
+    """
+    Role bucket of the current viewer. Cached pages may only depend on it,
+    never on who exactly the viewer is.
+
+    Args:
+        admin: Viewer is a web admin
+        member: Viewer is a member of the operator shown on the page
+    """
+    if admin and member:
+        return f"{ADMIN}+{MEMBER}"
+    if admin:
+        return ADMIN
+    if member:
+        return MEMBER
+    if session.get('user'):
+        return USER
+    return ANONYMOUS
+
+
+def render_cached(template: str, version: Any, role: str, context: Callable[[], Dict[str, Any]],
+                  admin: bool = False) -> str:
+    """
+    Render a template extending base/base.html through the page cache.
+    Anonymous viewers get the cached page as is. For signed in viewers the
+    page is cached without the navbar, which is rendered per request.
+
+    Args:
+        template: Template name
+        version: Version of the data shown on the page (part of the cache key)
+        role: Viewer role bucket from viewer_role()
+        context: Callable returning the template context, only called on a cache miss
+        admin: Viewer is a web admin (passed to the page and the navbar)
+
+    Returns:
+        The rendered page
+
+    Example:
+        return render_cached('index.html', LineController.get_lines_version(),
+                             viewer_role(admin), lambda: {'line_types': ...}, admin=admin)
+    """
+    key = f"{template}|{version}|{role}"
+    page = page_cache.get(key)
+
+    if page is None:
+        if role == ANONYMOUS:
+            page = render_template(template, admin=admin, **context())
+        else:
+            page = render_template(template, admin=admin, navbar=NAVBAR_PLACEHOLDER, **context())
+        page_cache.set(key, page)
+
+    if role == ANONYMOUS:
+        return page
+
+    return page.replace(NAVBAR_PLACEHOLDER, render_template('base/nav.html', admin=admin), 1)
+
+
+def render_fragment(template: str, version: Any, context: Callable[[], Dict[str, Any]]) -> str:
+    """
+    Render a page fragment (a template without base/base.html) through the
+    page cache. Fragments are the same for every viewer.
+
+    Args:
+        template: Template name
+        version: Version of the data shown in the fragment (part of the cache key)
+        context: Callable returning the template context, only called on a cache miss
+
+    Returns:
+        The rendered fragment
+    """
+    key = f"{template}|{version}"
+    fragment = page_cache.get(key)
+
+    if fragment is None:
+        fragment = render_template(template, **context())
+        page_cache.set(key, fragment)
+
+    return fragment
@@ -2,7 +2,8 @@ from flask import Blueprint, render_template, redirect, url_for, session
 from core import main_dir
 from core.logger import Logger
 from core.config import config
-from core.controller import OperatorController, OperatorRequestController
+from core.controller import OperatorRequestController
+from core.logs import read_logs
 
 import yaml
 
@@ -17,16 +18,9 @@ def admin_route():
     if not user or user.get('id') not in config.web_admins:
         return redirect(url_for('index.index_route'))
 
-    operators = OperatorController.get_all_operators()
-
-    operator = None
-    if user and 'id' in user:
-        operator = [op for op in operators if user['id'] in op['users']]
-
     return render_template(
         'admin/admin.html',
         user=user,
-        operator=operator,
         admin=True,
     )
 
@@ -41,17 +35,10 @@ def admin_settings():
     with open(main_dir + '/config.yml') as f:
         settings = yaml.load(f, Loader=yaml.SafeLoader)
 
-    operators = OperatorController.get_all_operators()
-
-    operator = None
-    if user and 'id' in user:
-        operator = [op for op in operators if user['id'] in op['users']]
-
     return render_template(
         'admin/settings.html',
         user=user,
         admin=True,
-        operator=operator,
         config=settings
     )
 
@@ -63,36 +50,17 @@ def admin_logs():
     if not user or user.get('id') not in config.web_admins:
         return redirect(url_for('index.index_route'))
 
-    with open(main_dir + '/server.log') as f:
-        logs = f.readlines()
-
-    logs = [log.strip() for log in logs if log.strip()]
-
-    parsed_logs = []
-    for log in logs:
-        parts = log.split(' - ', 1)
-        if len(parts) == 2:
-            timestamp = parts[0]
-            rest = parts[1].split(' - ', 1)
-            message = rest[1] if len(rest) > 1 else rest[0]
-            parsed_logs.append((timestamp, message))
-        else:
-            parsed_logs.append(('', log))
+    logs = read_logs(limit=200)
 
     logger.admin(f'[@{session.get("user")["username"]}] Accessed server logs')
 
-    operators = OperatorController.get_all_operators()
-
-    operator = None
-    if user and 'id' in user:
-        operator = [op for op in operators if user['id'] in op['users']]
-
     return render_template(
         'admin/logs.html',
         user=user,
         admin=True,
-        operator=operator,
-        logs=parsed_logs
+        logs=logs['entries'],
+        cursor=logs['cursor'],
+        next_cursor=logs['next_cursor']
     )
 
 
@@ -103,12 +71,6 @@ def admin_companies():
     if not user or user.get('id') not in config.web_admins:
         return redirect(url_for('index.index_route'))
 
-    operators = OperatorController.get_all_operators()
-
-    operator = None
-    if user and 'id' in user:
-        operator = [op for op in operators if user['id'] in op['users']]
-
     requests = OperatorRequestController.get_all_requests()
     requests.sort(key=lambda x: x['timestamp'], reverse=True)
 
@@ -116,7 +78,6 @@ def admin_companies():
         'admin/companies.html',
         user=user,
         admin=True,
-        operator=operator,
         requests=requests
     )
 
@@ -128,15 +89,8 @@ def admin_database():
     if not user or user.get('id') not in config.web_admins:
         return redirect(url_for('index.index_route'))
 
-    operators = OperatorController.get_all_operators()
-
-    operator = None
-    if user and 'id' in user:
-        operator = [op for op in operators if user['id'] in op['users']]
-
     return render_template(
         'admin/database.html',
         user=user,
         admin=True,
-        operator=operator,
     )
@@ -1,20 +1,61 @@
-from flask import Blueprint, jsonify, session, request
+from flask import Blueprint, Response, current_app, jsonify, session, request
 from core import main_dir
+from core.cache import DataVersion
 from core.logger import Logger
 from core.config import config
 from core.controller import LineController, OperatorController, StationController, OperatorRequestController
-from core.utils import fetch_discord_user
+from core.logs import read_logs, read_logs_after, search_log_index
+from core.network import railway_network
+from core.render import render_fragment
+from core.utils import get_discord_user_async, discord_user_refresher
+
+from datetime import datetime
 
 import os
+import gzip
+import json
+import hashlib
 import yaml
 import requests
+import threading
+import time
 
 api = Blueprint('api', __name__)
 logger = Logger("@api")
 
+# Every open /api/lines/stream connection holds a thread; the production
+# server reserves max_streams threads per process for them (gunicorn.conf.py).
+# Clients above the limit poll ?since= instead.
+STREAM_RETRY_AFTER = 30
+# Seconds an open stream waits before retrying when lines could not be loaded
+STREAM_ERROR_DELAY = 5
+_stream_slots = threading.BoundedSemaphore(max(1, config.max_streams))
+
+# Bumped when the settings are saved, so that every worker process reloads config.yml
+config_version = DataVersion("config")
+_config_changes_seen = config_version.external_changes
+
+
+@api.before_app_request
+def reload_changed_config():
+    """Reload config.yml when another worker process saved the settings."""
+    global _config_changes_seen
+    changes = config_version.external_changes
+    if changes == _config_changes_seen:
+        return
+
+    _config_changes_seen = changes
+    try:
+        config.load()
+    except Exception as e:
+        logger.error(f"Error reloading config.yml: {str(e)}")
+
 """
     --- API Routes ---
     - /api/lines [GET]
+    - /api/lines?since=<version> [GET]
+    - /api/lines/stream [GET]
+    - /api/lines/board [GET]
     - /api/lines [POST]
     - /api/lines/<name> [PUT]
     - /api/lines/<name> [DELETE]
@@ -22,7 +63,9 @@ logger = Logger("@api")
     - /api/operators/<name> [PUT]
     - /api/operators/request [POST]
     - /api/stations [GET]
+    - /api/route?from=<station>&to=<station> [GET]
     - /api/admin/logs [GET]     
+    - /api/admin/discord/cache [GET]
     - /api/admin/settings/update [POST]
     - /api/admin/companies/handle-request [POST]
 """
@@ -33,17 +76,183 @@ logger = Logger("@api")
 """
 
 
+def build_lines_payload(lines):
+    """
+    Serialize the line list once per data version.
+    Returns the plain and gzipped body together with a strong ETag.
+    """
+    body = (current_app.json.dumps([LineController.public_line(line) for line in lines]) + '\n').encode('utf-8')
+    etag = 'lines-' + hashlib.sha256(body).hexdigest()[:32]
+
+    return {
+        'body': body,
+        'gzip': gzip.compress(body, compresslevel=6),
+        'etag': etag,
+    }
+
+
 # GET /api/lines
+# GET /api/lines?since=<version>
 @api.route('/api/lines', methods=['GET'])
 async def get_lines():
     try:
-        lines = LineController.get_all_lines()
-        return jsonify(lines), 200
+        since = request.args.get('since')
+        if since is not None:
+            try:
+                since = int(since)
+            except ValueError:
+                return jsonify({'error': 'Invalid version'}), 400
+
+            delta = LineController.get_changes_since(since)
+            if delta is None:
+                # The client keeps its data and asks again with the same version
+                return jsonify({'error': 'Lines are temporarily unavailable'}), 503, {'Retry-After': '5'}
+
+            return jsonify(delta), 200
+
+        payload = await LineController.get_derived_async('api_payload', build_lines_payload)
+        if payload is None:
+            return jsonify({'error': 'Failed to fetch lines'}), 500
+
+        use_gzip = request.accept_encodings['gzip'] > 0
+        etag = payload['etag'] + ('-gz' if use_gzip else '')
+
+        headers = {
+            'Cache-Control': 'no-cache',
+            'Vary': 'Accept-Encoding',
+        }
+
+        if request.if_none_match.contains(etag):
+            response = Response(status=304, headers=headers)
+            response.set_etag(etag)
+            return response
+
+        response = Response(
+            payload['gzip'] if use_gzip else payload['body'],
+            status=200,
+            mimetype='application/json',
+            headers=headers
+        )
+        if use_gzip:
+            response.headers['Content-Encoding'] = 'gzip'
+        response.set_etag(etag)
+        return response
+
     except Exception as e:
         logger.error(f"Error while fetching lines: {str(e)}")
         return jsonify({'error': str(e)}), 500
 
 
+def format_line_events(delta):
+    """
+    Turn a line delta from LineController.get_changes_since into
+    Server-Sent Events. The event id is the line data version.
+    """
+    event_id = delta['version']
+
+    if delta['full']:
+        yield f"id: {event_id}\nevent: reset\ndata: {json.dumps({'lines': delta['lines']})}\n\n"
+        return
+
+    for line in delta['created'] + delta['updated']:
+        yield f"id: {event_id}\nevent: update\ndata: {json.dumps(line)}\n\n"
+
+    for name in delta['deleted']:
+        yield f"id: {event_id}\nevent: delete\ndata: {json.dumps({'name': name})}\n\n"
+
+
+# GET /api/lines/stream
+@api.route('/api/lines/stream', methods=['GET'])
+def stream_lines():
+    if not _stream_slots.acquire(blocking=False):
+        return Response(
+            f"retry: {STREAM_RETRY_AFTER * 1000}\n\n",
+            status=503,
+            mimetype='text/event-stream',
+            headers={
+                'Cache-Control': 'no-cache',
+                'Retry-After': str(STREAM_RETRY_AFTER),
+            }
+        )
+
+    # Subscribers only wait on the in-memory line version and read the shared
+    # snapshot, so an open stream does not hold a database connection
+    current = LineController.get_lines_version()
+    last_event_id = request.headers.get('Last-Event-ID') or request.args.get('since')
+
+    try:
+        start_version = int(last_event_id) if last_event_id else current
+    except ValueError:
+        start_version = current
+
+    def events():
+        version = start_version
+        yield 'retry: 5000\n\n'
+
+        while True:
+            if version == LineController.get_lines_version() and not LineController.wait_for_change(version, 15):
+                yield ': keep-alive\n\n'
+                continue
+
+            delta = LineController.get_changes_since(version)
+            if delta is None:
+                # Lines could not be loaded, try again without skipping the changes
+                time.sleep(STREAM_ERROR_DELAY)
+                yield ': keep-alive\n\n'
+                continue
+
+            yield from format_line_events(delta)
+            version = delta['version']
+
+    response = Response(
+        events(),
+        mimetype='text/event-stream',
+        headers={
+            'Cache-Control': 'no-cache',
+            'X-Accel-Buffering': 'no',
+        }
+    )
+    # Called by the server when the stream ends or the client disconnects
+    response.call_on_close(_stream_slots.release)
+    return response
+
+
+# GET /api/lines/board
+@api.route('/api/lines/board', methods=['GET'])
+def get_line_board():
+    # The homepage line board as HTML, re-fetched by the page after line changes
+    try:
+        version = LineController.get_lines_version()
+        etag = f'board-{version}'
+
+        headers = {'Cache-Control': 'no-cache'}
+        if request.if_none_match.contains(etag):
+            response = Response(status=304, headers=headers)
+            response.set_etag(etag)
+            return response
+
+        def context():
+            line_types = LineController.get_line_board()
+            if line_types is None:
+                # Don't cache an empty board
+                raise RuntimeError("Lines could not be loaded")
+
+            return {'line_types': line_types, 'lines_version': version}
+
+        response = Response(
+            render_fragment('line-board.html', version, context),
+            status=200,
+            mimetype='text/html',
+            headers=headers
+        )
+        response.set_etag(etag)
+        return response
+
+    except Exception as e:
+        logger.error(f"Error while rendering line board: {str(e)}")
+        return jsonify({'error': str(e)}), 500
+
+
 # POST /api/lines
 @api.route('/api/lines', methods=['POST'])
 async def add_line():
@@ -222,7 +431,7 @@ async def delete_line(name):
 @api.route('/api/operators', methods=['GET'])
 async def get_operators():
     try:
-        operators = OperatorController.get_all_operators()
+        operators = await OperatorController.get_all_operators_async()
         return jsonify(operators), 200
     except Exception as e:
         logger.error(f"Error while fetching operators: {str(e)}")
@@ -340,9 +549,9 @@ def request_operator():
 
 # GET /api/stations
 @api.route('/api/stations', methods=['GET'])
-def get_stations():
+async def get_stations():
     try:
-        stations = StationController.get_all_stations()
+        stations = await StationController.get_all_stations_async()
         return jsonify(stations)
     except Exception as e:
         logger.error(f"Error while fetching stations: {str(e)}")
@@ -353,28 +562,12 @@ def get_stations():
 @api.route('/api/stations/<name>', methods=['GET'])
 def get_station_details(name):
     try:
-        is_id = name.isdigit()
+        details = StationController.get_station_details(name)
         
-        if is_id:
-            station = StationController.get_station_by_id(int(name))
-            name = station['name'] if station else None
-        else:
-            station = StationController.get_station_by_name(name)
-            
-        if not station:
+        if not details:
             return jsonify({'error': 'Station not found'}), 404
         
-        # Get lines at this station
-        lines = StationController.get_lines_at_station(name)
-        
-        # Get statistics
-        stats = StationController.get_station_statistics(name)
-        
-        return jsonify({
-            'station': station,
-            'lines': lines,
-            'statistics': stats
-        }), 200
+        return jsonify(details), 200
     except Exception as e:
         logger.error(f"Error while fetching station details: {str(e)}")
         return jsonify({'error': str(e)}), 500
@@ -384,13 +577,38 @@ def get_station_details(name):
 @api.route('/api/stations/search/<term>', methods=['GET'])
 def search_stations(term):
     try:
-        stations = StationController.search_stations(term)
+        limit = min(max(request.args.get('limit', 10, type=int), 1), 50)
+        stations = StationController.search_stations(term, limit)
         return jsonify({'stations': stations}), 200
     except Exception as e:
         logger.error(f"Error while searching stations: {str(e)}")
         return jsonify({'error': str(e)}), 500
 
 
+# GET /api/route?from=<station>&to=<station>
+@api.route('/api/route', methods=['GET'])
+def find_route():
+    from_name = request.args.get('from', '').strip()
+    to_name = request.args.get('to', '').strip()
+    if not from_name or not to_name:
+        return jsonify({'error': 'Missing from or to station'}), 400
+
+    try:
+        from_station = railway_network.find_station(from_name)
+        to_station = railway_network.find_station(to_name)
+        if from_station is None or to_station is None:
+            return jsonify({'error': 'Station not found'}), 404
+
+        route = railway_network.find_route(from_station, to_station)
+        if route is None:
+            return jsonify({'error': 'No route found'}), 404
+
+        return jsonify(route), 200
+    except Exception as e:
+        logger.error(f"Error while finding route: {str(e)}")
+        return jsonify({'error': str(e)}), 500
+
+
 # POST /api/stations/update
 @api.route('/api/stations/update', methods=['POST'])
 def update_station():
@@ -583,29 +801,87 @@ def create_station():
     --- ADMIN ROUTES ---
 """
 
+def parse_log_time(value):
+    """Parse a unix timestamp or ISO 8601 date for log queries (None if not given)."""
+    if not value:
+        return None
+    try:
+        return float(value)
+    except ValueError:
+        return datetime.fromisoformat(value).timestamp()
+
+
 # GET /api/admin/logs
 @api.route('/api/admin/logs')
 def update_logs():
+    """
+    Returns server log entries, newest first, a page at a time.
+    Query parameters:
+        before: next_cursor of the previous page
+        after: cursor of a previous call, returns only newer entries (oldest first)
+        limit: maximum number of entries (default 200)
+        level, logger, q: filter by level, logger name or text
+        user, since, until: filter by user (ID or name) and time (unix or ISO 8601),
+            only with the log index enabled
+
+    With the log index enabled (logging.index), filtered queries are
+    answered from the index instead of scanning the log files.
+    """
     user = session.get('user')
 
     if not user or user.get('id') not in config.web_admins:
         return jsonify({'success': False, 'error': 'Unauthorized'}), 403
 
     try:
-        with open(main_dir + '/server.log') as f:
-            logs = f.readlines()
+        limit = request.args.get('limit', 200, type=int)
+
+        after = request.args.get('after')
+        if after:
+            return jsonify({'success': True, **read_logs_after(after, limit=limit)})
+
+        before = request.args.get('before')
+        filters = ('level', 'logger', 'q', 'user', 'since', 'until')
+        # Index cursors are plain ids, file cursors are "<inode>:<offset>"
+        if config.log_index and (any(request.args.get(f) for f in filters) or (before and ':' not in before)):
+            logs = search_log_index(
+                before=int(before) if before else None,
+                limit=limit,
+                level=request.args.get('level'),
+                logger_name=request.args.get('logger'),
+                user=request.args.get('user'),
+                text=request.args.get('q'),
+                since=parse_log_time(request.args.get('since')),
+                until=parse_log_time(request.args.get('until'))
+            )
+            return jsonify({'success': True, **logs})
 
-        logs = [log.strip() for log in logs if log.strip()]
-        logs = [log.split(' - ', 1) for log in logs]
-        logs = [(log[0], log[1].split(' - ', 1)[1] if len(log) > 1 else '')
-                for log in logs]
+        logs = read_logs(
+            before=before,
+            limit=limit,
+            level=request.args.get('level'),
+            logger_name=request.args.get('logger'),
+            text=request.args.get('q')
+        )
+        return jsonify({'success': True, **logs})
 
-        return jsonify({'success': True, 'logs': logs})
+    except ValueError as e:
+        return jsonify({'success': False, 'error': f'Invalid query parameter: {str(e)}'}), 400
 
     except Exception as e:
         return jsonify({'success': False, 'error': str(e)}), 500
 
 
+# GET /api/admin/discord/cache
+@api.route('/api/admin/discord/cache')
+def discord_cache_stats():
+    user = session.get('user')
+
+    if not user or user.get('id') not in config.web_admins:
+        return jsonify({'success': False, 'error': 'Unauthorized'}), 403
+
+    return jsonify({'success': True, 'stats': discord_user_refresher.get_stats()})
+
+
 # POST /api/admin/companies/handle-request
 @api.route('/api/admin/companies/handle-request', methods=['POST'])
 def handle_company_request():
@@ -700,6 +976,7 @@ def save_settings():
             )
 
         config.load()
+        config_version.bump()
 
         logger.admin(
             f'[@{session.get("user")["username"]}] Updated application settings')
@@ -721,7 +998,7 @@ async def get_discord_user(user_id):
     Fetch Discord user data (username, display name, avatar) via Discord API
     """
     try:
-        user_data = fetch_discord_user(user_id, config.discord_bot_token)
+        user_data = await get_discord_user_async(user_id)
         
         if user_data is None:
             logger.error(f"Failed to fetch Discord user data for {user_id}")
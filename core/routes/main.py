@@ -2,9 +2,8 @@ from flask import Blueprint, render_template, session, redirect, url_for
 from core.config import config
 from core.controller import LineController, OperatorController, StationController, OperatorRequestController
 from core.logger import Logger
-from core.utils import fetch_discord_user
-
-import re
+from core.utils import get_discord_user
+from core.render import render_cached, viewer_role
 
 main = Blueprint('index', __name__)
 logger = Logger("@main")
@@ -14,80 +13,40 @@ logger = Logger("@main")
 def index_route():
     user = session.get('user')
 
-    lines = LineController.get_all_lines()
-    operators = OperatorController.get_all_operators()
-
-    operator = None
     admin = False
 
-    if user and 'id' in user:
-        operator = [op for op in operators if user['id'] in op['users']]
-
     if user and user["id"] in config.web_admins:
         admin = True
 
-    line_types = {
-        'public': {'suspended': [], 'partially_suspended': [], 'running': [], 'possible_delays': [], 'no_scheduled': []},
-        'private': {'suspended': [], 'partially_suspended': [], 'running': [], 'possible_delays': [], 'no_scheduled': []},
-        'metro': {'suspended': [], 'partially_suspended': [], 'running': [], 'possible_delays': [], 'no_scheduled': []},
-        'tram': {'suspended': [], 'partially_suspended': [], 'running': [], 'possible_delays': [], 'no_scheduled': []},
-        "bus": {'suspended': [], 'partially_suspended': [], 'running': [], 'possible_delays': [], 'no_scheduled': []},
-    }
+    lines_version = LineController.get_lines_version()
 
-    for line in lines:
-        if 'notice' in line:
-            if line['notice'] is None or line['notice'].strip() == '':
-                line['notice'] = None
-            else:
-                line['notice'] = line['notice'].strip()
-        else:
-            line['notice'] = None
-
-        line_type = line.get('type', 'public')
-        status_key = {
-            'Suspended': 'suspended',
-            'Partially suspended': 'partially_suspended',
-            'Running': 'running',
-            'Possible delays': 'possible_delays',
-            'No scheduled service': 'no_scheduled'
-        }.get(line['status'])
-
-        if status_key and line_type in line_types:
-            line_types[line_type][status_key].append(line)
-
-    # Sort each status list in each line type
-    for line_type in line_types.values():
-        for status in line_type.values():
-            status.sort(key=lambda x: (
-                # alphabetical part
-                ''.join([i for i in x['name'] if not i.isdigit()]),
-                [int(''.join(g)) for g in re.findall(
-                    r'\d+', x['name'])] or [0]  # numerical part
-            ))
+    def context():
+        # Grouped and sorted once per line data version
+        line_types = LineController.get_line_board()
+        if line_types is None:
+            # Don't cache an empty board
+            raise RuntimeError("Lines could not be loaded")
 
-    return render_template(
-        'index.html',
-        user=user,
-        operator=operator,
-        admin=admin,
-        line_types=line_types,
-        maintenance_mode=config.maintenance_mode,
-        maintenance_message=config.maintenance_message
-    )
+        return {
+            'line_types': line_types,
+            # The page subscribes to line changes from this version on
+            'lines_version': lines_version,
+            'maintenance_mode': config.maintenance_mode,
+            'maintenance_message': config.maintenance_message
+        }
+
+    # The maintenance notice can be changed at runtime in the admin settings
+    version = (lines_version, config.maintenance_mode, hash(config.maintenance_message))
+
+    return render_cached('index.html', version, viewer_role(admin), context, admin=admin)
 
 
 @main.route('/computercraft-setup')
 def computercraft_setup_route():
     user = session.get('user')
 
-    operators = OperatorController.get_all_operators()
-
-    operator = None
     admin = False
 
-    if user and 'id' in user:
-        operator = [op for op in operators if user['id'] in op['users']]
-
     if user and user["id"] in config.web_admins:
         admin = True
 
@@ -95,7 +54,6 @@ def computercraft_setup_route():
         'computercraft-setup.html',
         user=user,
         admin=admin,
-        operator=operator,
     )
 
 
@@ -103,45 +61,32 @@ def computercraft_setup_route():
 def stations_route():
     user = session.get('user')
 
-    operators = OperatorController.get_all_operators()
-    stations = StationController.get_all_stations()
-    total_stations = len(stations)
-    active_stations = len([s for s in stations if s['status'] == 'open'])
-    connecting_lines = LineController.get_all_line_stations_count()
-
-    operator = None
     admin = False
 
-    if user and 'id' in user:
-        operator = [op for op in operators if user['id'] in op['users']]
-
     if user and user["id"] in config.web_admins:
         admin = True
 
-    return render_template(
-        'stations.html',
-        user=user,
-        admin=admin,
-        operator=operator,
-        stations=stations,
-        total_stations=total_stations,
-        active_stations=active_stations,
-        connecting_lines=connecting_lines
-    )
+    def context():
+        stations = StationController.get_all_stations()
+        return {
+            'stations': stations,
+            'total_stations': len(stations),
+            'active_stations': len([s for s in stations if s['status'] == 'open']),
+            'connecting_lines': sum(len(s['lines']) for s in stations)
+        }
+
+    # Station cards list their lines, so both versions are part of the key
+    version = (LineController.get_lines_version(), StationController.get_stations_version())
+
+    return render_cached('stations.html', version, viewer_role(admin), context, admin=admin)
 
 
 @main.route('/api-docs')
 def api_docs_route():
     user = session.get('user')
 
-    operators = OperatorController.get_all_operators()
-
-    operator = None
     admin = False
 
-    if user and 'id' in user:
-        operator = [op for op in operators if user['id'] in op['users']]
-
     if user and user['id'] in config.web_admins:
         admin = True
 
@@ -149,7 +94,6 @@ def api_docs_route():
         'api-docs.html',
         user=user,
         admin=admin,
-        operator=operator,
     )
 
 
@@ -171,12 +115,8 @@ def user_profile_route(user_id):
     all_lines = LineController.get_all_lines() or []
     all_requests = OperatorRequestController.get_all_requests() or []
 
-    nav_operator = None
     admin = False
 
-    if current_user and 'id' in current_user:
-        nav_operator = [op for op in all_operators if current_user['id'] in op.get('users', [])]
-
     if current_user and current_user['id'] in config.web_admins:
         admin = True
 
@@ -196,7 +136,7 @@ def user_profile_route(user_id):
         'rejected': len([r for r in user_requests if r.get('status') == 'rejected'])
     }
 
-    discord_user = fetch_discord_user(user_id, config.discord_bot_token) or {
+    discord_user = get_discord_user(user_id) or {
         'id': user_id,
         'username': user_id,
         'display_name': user_id,
@@ -211,7 +151,6 @@ def user_profile_route(user_id):
         'users.html',
         user=current_user,
         admin=admin,
-        operator=nav_operator,
         profile_user=discord_user,
         is_self=is_self,
         member_operators=member_operators,
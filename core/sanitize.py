@@ -0,0 +1,24 @@
+from functools import lru_cache
+from core.config import allowed_tags, allowed_attributes
+from bleach import clean
+
+
+def sanitize_html(text: str) -> str:
+    """
+    Clean user supplied HTML with the allowed_tags/allowed_attributes whitelist.
+    Expensive, so line notices are cleaned once when they are written and
+    stored as line.notice_html.
+
+    Args:
+        text: Raw HTML
+
+    Returns:
+        Sanitized HTML without trailing whitespace
+    """
+    return clean(text or '', tags=allowed_tags, attributes=allowed_attributes, strip=True).rstrip()
+
+
+@lru_cache(maxsize=4096)
+def sanitize_station_name(name: str) -> str:
+    """Sanitize a station name for display; names repeat across lines, so results are memoized."""
+    return clean(name, tags=allowed_tags, attributes=allowed_attributes, strip=True)
@@ -0,0 +1,227 @@
+from typing import Any, Callable, Dict, Iterable, List, Optional, Tuple
+from bisect import bisect_left, insort
+from collections import Counter
+from core.logger import Logger
+
+import heapq
+import threading
+import unicodedata
+
+logger = Logger("@search")
+
+# Minimum trigram similarity for a fuzzy (typo tolerant) match
+FUZZY_THRESHOLD = 0.4
+
+
+def normalize(text: str) -> str:
+    """Lower case, accents removed and whitespace collapsed, for matching."""
+    text = unicodedata.normalize('NFKD', text or '')
+    text = ''.join(char for char in text if not unicodedata.combining(char))
+    return ' '.join(text.casefold().split())
+
+
+def trigrams(text: str) -> set:
+    """Trigrams of a normalized text, padded so short texts and word starts count."""
+    padded = f"  {text} "
+    return {padded[i:i + 3] for i in range(len(padded) - 2)}
+
+
+class SearchIndex:
+    """
+    In-memory search index over a few text fields per document.
+    Matches exact names, name and word prefixes, substrings and (using
+    trigram similarity) misspellings, ranked in that order.
+
+    The index is loaded lazily with one call to the loader and then kept
+    up to date with add()/remove() by the code that writes the documents.
+    Changes made by other processes are picked up by reloading when the
+    optional version changes.
+    """
+
+    def __init__(self, name: str, loader: Callable[[], Optional[List[Tuple[Any, Dict[str, Any], List[str]]]]],
+                 version: Optional[Callable[[], Any]] = None):
+        """
+        Args:
+            name: Name of the index (used for logging)
+            loader: Callable returning (id, document, texts) for all documents,
+                or None on failure. The document is returned by search().
+            version: Callable returning a value that changes when the documents
+                were changed without add()/remove() (e.g. by another process)
+        """
+        self.name = name
+        self._loader = loader
+        self._version = version
+        self._loaded_version = None
+        self._lock = threading.RLock()
+        self._loaded = False
+        self._documents = {}
+        self._texts = {}
+        self._text_trigrams = {}
+        # Sorted (text, id) of every normalized text and every word in it
+        self._prefixes = []
+        self._trigrams = {}
+
+    def _ensure_loaded(self) -> bool:
+        version = self._version() if self._version else None
+        if self._loaded and self._loaded_version == version:
+            return True
+
+        with self._lock:
+            if self._loaded and self._loaded_version == version:
+                return True
+            if self._loaded:
+                self.invalidate()
+
+            documents = self._loader()
+            if documents is None:
+                return False
+
+            for doc_id, document, texts in documents:
+                self._add(doc_id, document, texts, keep_sorted=False)
+            self._prefixes.sort()
+            self._loaded = True
+            self._loaded_version = version
+            logger.debug(f"Loaded {self.name} search index ({len(self._documents)} documents)")
+            return True
+
+    def add(self, doc_id: Any, document: Dict[str, Any], texts: Iterable[Optional[str]]):
+        """
+        Add or replace a document. Does nothing before the index is loaded,
+        the loader will pick the document up.
+
+        Args:
+            doc_id: Unique ID of the document
+            document: Value returned by search()
+            texts: Texts to match against (e.g. name and alternative name)
+        """
+        with self._lock:
+            if not self._loaded:
+                return
+            self._remove(doc_id)
+            self._add(doc_id, document, texts)
+
+    def remove(self, doc_id: Any):
+        """Remove a document if it is in the index."""
+        with self._lock:
+            if self._loaded:
+                self._remove(doc_id)
+
+    def invalidate(self):
+        """Drop the index; it is reloaded by the next search."""
+        with self._lock:
+            self._loaded = False
+            self._documents = {}
+            self._texts = {}
+            self._text_trigrams = {}
+            self._prefixes = []
+            self._trigrams = {}
+
+    def _add(self, doc_id, document, texts, keep_sorted=True):
+        texts = [text for text in dict.fromkeys(normalize(text) for text in texts if text) if text]
+        self._documents[doc_id] = document
+        self._texts[doc_id] = texts
+        keys = list(dict.fromkeys(key for text in texts for key in (text, *text.split(' '))))
+        # (key, trigrams) of whole texts and single words, for typo matching
+        self._text_trigrams[doc_id] = [(key, trigrams(key)) for key in keys]
+
+        for key in keys:
+            if keep_sorted:
+                insort(self._prefixes, (key, doc_id))
+            else:
+                self._prefixes.append((key, doc_id))
+        for _, key_trigrams in self._text_trigrams[doc_id]:
+            for trigram in key_trigrams:
+                self._trigrams.setdefault(trigram, set()).add(doc_id)
+
+    def _remove(self, doc_id):
+        if doc_id not in self._documents:
+            return
+
+        texts = self._texts.pop(doc_id)
+        for key in dict.fromkeys(key for text in texts for key in (text, *text.split(' '))):
+            index = bisect_left(self._prefixes, (key, doc_id))
+            if index < len(self._prefixes) and self._prefixes[index] == (key, doc_id):
+                del self._prefixes[index]
+        for _, key_trigrams in self._text_trigrams.pop(doc_id):
+            for trigram in key_trigrams:
+                postings = self._trigrams.get(trigram)
+                if postings is not None:
+                    postings.discard(doc_id)
+                    if not postings:
+                        del self._trigrams[trigram]
+        del self._documents[doc_id]
+
+    def _match_substrings(self, query: str, scores: Dict[Any, float]):
+        """
+        Score documents containing the query anywhere in a text. Padded
+        trigrams under-count matches inside a word (e.g. "ost" in Boston),
+        so this doesn't depend on the fuzzy threshold.
+        """
+        inner = [query[i:i + 3] for i in range(len(query) - 2)]
+        if inner:
+            # Every text containing the query contains all its trigrams
+            postings = sorted((self._trigrams.get(trigram, set()) for trigram in inner), key=len)
+            candidates = set(postings[0]).intersection(*postings[1:])
+        else:
+            # Too short for a trigram, check every document
+            candidates = self._texts.keys()
+
+        for doc_id in candidates:
+            if scores.get(doc_id, 0) < 2.0 and any(query in text for text in self._texts[doc_id]):
+                scores[doc_id] = 2.0
+
+    def search(self, term: str, limit: int = 10) -> List[Dict[str, Any]]:
+        """
+        Search documents, best matches first.
+
+        Args:
+            term: Search term (case and accent insensitive)
+            limit: Maximum number of results
+
+        Returns:
+            List of documents
+        """
+        query = normalize(term)
+        if not query or limit <= 0 or not self._ensure_loaded():
+            return []
+
+        with self._lock:
+            scores = {}
+
+            # Exact and prefix matches of whole texts or single words
+            index = bisect_left(self._prefixes, (query,))
+            while index < len(self._prefixes) and self._prefixes[index][0].startswith(query):
+                key, doc_id = self._prefixes[index]
+                score = 4.0 if key in self._texts[doc_id] and key == query else 3.0
+                if scores.get(doc_id, 0) < score:
+                    scores[doc_id] = score
+                index += 1
+
+            # Substring and fuzzy matches rank below prefix matches, so they
+            # are only needed if there are too few of those
+            query_trigrams = trigrams(query)
+            shared = Counter()
+            if len(scores) < limit:
+                self._match_substrings(query, scores)
+                for trigram in query_trigrams:
+                    shared.update(self._trigrams.get(trigram, ()))
+
+            for doc_id, count in shared.items():
+                # Similarity can't be higher than the share of the query's trigrams found
+                if scores.get(doc_id, 0) >= 2.0 or count < FUZZY_THRESHOLD * len(query_trigrams):
+                    continue
+                # Queries of several words are compared to whole texts only
+                texts = self._texts[doc_id]
+                similarity = max((
+                    len(query_trigrams & key_trigrams) / len(query_trigrams | key_trigrams)
+                    for key, key_trigrams in self._text_trigrams[doc_id]
+                    if ' ' not in query or key in texts
+                ), default=0)
+                if similarity >= FUZZY_THRESHOLD:
+                    scores[doc_id] = similarity
+
+            ranked = heapq.nsmallest(
+                limit, scores.items(),
+                key=lambda item: (-item[1], len(self._texts[item[0]][0]), self._texts[item[0]][0])
+            )
+            return [dict(self._documents[doc_id]) for doc_id, _ in ranked]
@@ -1,11 +1,153 @@
-from mysql.connector import Error, pooling
+from mysql.connector import Error, PoolError, pooling
+from concurrent.futures import ThreadPoolExecutor
 from contextlib import contextmanager
-from typing import Optional, List, Dict, Any, Tuple
+from contextvars import ContextVar, copy_context
+from typing import Optional, List, Dict, Any, Tuple, Callable
 from core.config import config
 from core.logger import Logger
 
+import asyncio
+import os
+import re
+import threading
+import time
+
 logger = Logger("@sql")
 
+# Transaction of the current request/thread, see SQLConnector.transaction()
+_current_transaction = ContextVar("sql_transaction", default=None)
+
+# Query statistics of the current request, see SQLConnector.start_query_stats()
+_current_query_stats = ContextVar("sql_query_stats", default=None)
+
+# Seconds to wait for a free pooled connection before giving up
+POOL_WAIT_TIMEOUT = 10
+# Threads running AsyncSQLConnector calls, each may hold a pooled connection
+ASYNC_SQL_WORKERS = 4
+
+_QUERY_LITERALS = re.compile(r"'(?:[^'\\]|\\.)*'|\b\d+(?:\.\d+)?\b")
+_QUERY_IN_LISTS = re.compile(r"\(\s*(?:%s|\?)(?:\s*,\s*(?:%s|\?))*\s*\)")
+_QUERY_WHITESPACE = re.compile(r"\s+")
+
+
+def normalize_query(query: str) -> str:
+    """
+    Reduce a query to its shape, so that the same statement with different
+    values (or IN lists of different length) is reported the same way.
+    
+    Example:
+        normalize_query("SELECT * FROM line WHERE id IN (%s, %s) LIMIT 1")
+        # -> "SELECT * FROM line WHERE id IN (...) LIMIT ?"
+    """
+    query = _QUERY_WHITESPACE.sub(' ', query).strip()
+    query = _QUERY_LITERALS.sub('?', query)
+    return _QUERY_IN_LISTS.sub('(...)', query)
+
+
+class _Transaction:
+    """State of an open unit of work: its pinned connection and failure flag."""
+    
+    def __init__(self, connection):
+        self.connection = connection
+        self.failed = False
+        self.on_commit = []
+
+
+class QueryStats:
+    """
+    Statement count and database timings collected for one request.
+    Shared with the threads running the request's async_sql calls, so
+    updates are locked.
+    """
+    
+    def __init__(self):
+        self.count = 0
+        self.db_time = 0.0
+        self.pool_wait = 0.0
+        self.slowest_time = 0.0
+        self.slowest_query = None
+        self._lock = threading.Lock()
+    
+    def record(self, query: str, elapsed: float):
+        """Record one finished statement (execute plus fetching its rows)."""
+        with self._lock:
+            self.count += 1
+            self.db_time += elapsed
+            if elapsed > self.slowest_time:
+                self.slowest_time = elapsed
+                self.slowest_query = normalize_query(query)
+    
+    def record_pool_wait(self, elapsed: float):
+        """Record time spent waiting for a pooled connection."""
+        with self._lock:
+            self.pool_wait += elapsed
+    
+    def to_dict(self) -> Dict[str, Any]:
+        """Statistics as a dictionary with timings in milliseconds."""
+        return {
+            'queries': self.count,
+            'db_ms': round(self.db_time * 1000, 2),
+            'pool_wait_ms': round(self.pool_wait * 1000, 2),
+            'slowest_ms': round(self.slowest_time * 1000, 2),
+            'slowest_query': self.slowest_query
+        }
+
+
+class _TimedCursor:
+    """
+    Cursor proxy that reports every statement to a QueryStats object.
+    Time spent fetching rows is counted towards the statement that produced them.
+    Only used while query statistics are enabled.
+    """
+    
+    def __init__(self, cursor, stats: QueryStats):
+        self._cursor = cursor
+        self._stats = stats
+        self._query = None
+        self._elapsed = 0.0
+    
+    def __getattr__(self, name):
+        return getattr(self._cursor, name)
+    
+    def __iter__(self):
+        return iter(self.fetchall())
+    
+    def _timed(self, method, *args, **kwargs):
+        start = time.perf_counter()
+        try:
+            return method(*args, **kwargs)
+        finally:
+            self._elapsed += time.perf_counter() - start
+    
+    def _finish(self):
+        if self._query is not None:
+            self._stats.record(self._query, self._elapsed)
+        self._query = None
+        self._elapsed = 0.0
+    
+    def execute(self, query, params=None, *args, **kwargs):
+        self._finish()
+        self._query = query
+        return self._timed(self._cursor.execute, query, params, *args, **kwargs)
+    
+    def executemany(self, query, seq_params, *args, **kwargs):
+        self._finish()
+        self._query = query
+        return self._timed(self._cursor.executemany, query, seq_params, *args, **kwargs)
+    
+    def fetchone(self):
+        return self._timed(self._cursor.fetchone)
+    
+    def fetchmany(self, *args, **kwargs):
+        return self._timed(self._cursor.fetchmany, *args, **kwargs)
+    
+    def fetchall(self):
+        return self._timed(self._cursor.fetchall)
+    
+    def close(self):
+        self._finish()
+        return self._cursor.close()
+
 
 class SQLConnector:
     """
@@ -16,14 +158,16 @@ class SQLConnector:
     def __init__(self):
         """Initialize the SQL connector with connection pool."""
         self.pool = None
+        self._checkouts = None
         self._initialize_pool()
     
-    def _initialize_pool(self):
+    def _initialize_pool(self, pool_size: Optional[int] = None):
         """Create a connection pool for better performance."""
+        pool_size = pool_size or config.db_pool_size
         try:
             self.pool = pooling.MySQLConnectionPool(
                 pool_name="railway_info_pool",
-                pool_size=15,
+                pool_size=pool_size,
                 pool_reset_session=True,
                 host=config.db_host,
                 port=config.db_port,
@@ -37,12 +181,18 @@ class SQLConnector:
         except Error as e:
             logger.error(f"Error creating connection pool: {e}")
             raise
+        
+        # The pool raises PoolError instead of waiting when all connections
+        # are checked out, so checkouts are counted here and wait for a slot
+        self._checkouts = threading.BoundedSemaphore(pool_size)
     
     @contextmanager
     def get_connection(self):
         """
         Context manager for database connections.
         Automatically handles connection lifecycle and error handling.
+        Waits up to POOL_WAIT_TIMEOUT seconds if all pooled connections
+        are in use.
         
         Usage:
             with sql.get_connection() as conn:
@@ -50,8 +200,17 @@ class SQLConnector:
                 # ... do work ...
         """
         connection = None
+        # Released on the semaphore it was taken from, even if the pool is reset meanwhile
+        checkouts = self._checkouts
+        start = time.perf_counter()
+        if not checkouts.acquire(timeout=POOL_WAIT_TIMEOUT):
+            logger.error("Database error: no pooled connection became available")
+            raise PoolError(msg="No pooled connection available")
         try:
             connection = self.pool.get_connection()
+            stats = _current_query_stats.get()
+            if stats is not None:
+                stats.record_pool_wait(time.perf_counter() - start)
             yield connection
         except Error as e:
             if connection:
@@ -59,14 +218,79 @@ class SQLConnector:
             logger.error(f"Database error: {e}")
             raise
         finally:
-            if connection and connection.is_connected():
-                connection.close()
+            try:
+                # Always hand the connection back, a broken one is
+                # reconnected by the pool on its next checkout
+                if connection:
+                    connection.close()
+            except Error as e:
+                logger.warning(f"Error returning connection to the pool: {e}")
+            finally:
+                checkouts.release()
+    
+    @contextmanager
+    def transaction(self):
+        """
+        Context manager for a unit of work spanning several calls.
+        Pins one pooled connection to the current request/thread; every
+        CRUD helper called inside uses it and the work is committed once
+        at the end. Nested transactions join the outer one.
+        
+        If any query fails inside the transaction, everything is rolled
+        back and an Error is raised when the block ends, even if the
+        failing helper only logged the error and returned None/0.
+        
+        Usage:
+            with sql.transaction():
+                line_id = sql.insert('line', {...})
+                sql.insert_many('line_station', [...], [...])
+        """
+        if _current_transaction.get() is not None:
+            yield
+            return
+        
+        with self.get_connection() as connection:
+            transaction = _Transaction(connection)
+            token = _current_transaction.set(transaction)
+            try:
+                yield
+                if transaction.failed:
+                    raise Error(msg="Transaction rolled back after a failed query")
+                connection.commit()
+            except Exception:
+                connection.rollback()
+                raise
+            finally:
+                _current_transaction.reset(token)
+        
+        for callback in transaction.on_commit:
+            callback()
+    
+    def on_commit(self, callback):
+        """
+        Run a callback once the current transaction has been committed,
+        or right away if there is no transaction. Callbacks of rolled back
+        transactions are dropped.
+        
+        Args:
+            callback: Callable without arguments
+        
+        Example:
+            sql.on_commit(lambda: cache.invalidate())
+        """
+        transaction = _current_transaction.get()
+        if transaction is None:
+            callback()
+        else:
+            transaction.on_commit.append(callback)
     
     @contextmanager
     def get_cursor(self, dictionary=True):
         """
         Context manager for database cursor.
         Automatically commits on success, rolls back on error.
+        Inside sql.transaction() the transaction's connection is used and
+        committing is left to the transaction.
         
         Args:
             dictionary: If True, returns results as dictionaries
@@ -76,8 +300,21 @@ class SQLConnector:
                 cursor.execute("SELECT * FROM users")
                 results = cursor.fetchall()
         """
+        transaction = _current_transaction.get()
+        if transaction is not None:
+            cursor = self._wrap_cursor(transaction.connection.cursor(dictionary=dictionary))
+            try:
+                yield cursor
+            except Error as e:
+                transaction.failed = True
+                logger.error(f"Query error: {e}")
+                raise
+            finally:
+                cursor.close()
+            return
+        
         with self.get_connection() as connection:
-            cursor = connection.cursor(dictionary=dictionary)
+            cursor = self._wrap_cursor(connection.cursor(dictionary=dictionary))
             try:
                 yield cursor
                 connection.commit()
@@ -88,6 +325,47 @@ class SQLConnector:
             finally:
                 cursor.close()
     
+    @staticmethod
+    def _wrap_cursor(cursor):
+        """Wrap a cursor for timing if query statistics are being collected."""
+        stats = _current_query_stats.get()
+        return cursor if stats is None else _TimedCursor(cursor, stats)
+    
+    # ==================== Query Statistics ====================
+    
+    def start_query_stats(self):
+        """
+        Start collecting query statistics for the current request/thread.
+        Without an active collector no timing is done at all.
+        
+        Returns:
+            Token to pass to stop_query_stats()
+        
+        Example:
+            token = sql.start_query_stats()
+            ...
+            stats = sql.stop_query_stats(token)
+        """
+        return _current_query_stats.set(QueryStats())
+    
+    def get_query_stats(self) -> Optional[QueryStats]:
+        """Get the statistics collected so far, or None if not collecting."""
+        return _current_query_stats.get()
+    
+    def stop_query_stats(self, token) -> Optional[QueryStats]:
+        """
+        Stop collecting query statistics.
+        
+        Args:
+            token: Token returned by start_query_stats()
+        
+        Returns:
+            The collected statistics
+        """
+        stats = _current_query_stats.get()
+        _current_query_stats.reset(token)
+        return stats
+    
     # ==================== CREATE Operations ====================
     
     def insert(self, table: str, data: Dict[str, Any]) -> Optional[int]:
@@ -174,7 +452,7 @@ class SQLConnector:
         Args:
             table: Table name
             columns: List of columns to select (None = all columns)
-            where: Dictionary of conditions (AND logic)
+            where: Dictionary of conditions (AND logic), list values match with IN
             order_by: ORDER BY clause (e.g., 'created_at DESC')
             limit: Maximum number of results
         
@@ -188,15 +466,18 @@ class SQLConnector:
                 order_by='username ASC',
                 limit=10
             )
+            stations = sql.select('station', where={'name': ['Central', 'North']})
         """
         cols = ', '.join(f"`{col}`" for col in columns) if columns else '*'
         query = f"SELECT {cols} FROM `{table}`"
         params = []
         
         if where:
-            conditions = ' AND '.join(f"`{key}` = %s" for key in where.keys())
+            conditions, where_params = self._build_where(where)
+            if conditions is None:
+                return []
             query += f" WHERE {conditions}"
-            params.extend(where.values())
+            params.extend(where_params)
         
         if order_by:
             query += f" ORDER BY {order_by}"
@@ -213,6 +494,31 @@ class SQLConnector:
             logger.error(f"Error selecting from {table}: {e}")
             return []
     
+    @staticmethod
+    def _build_where(where: Dict[str, Any]) -> Tuple[Optional[str], List[Any]]:
+        """
+        Build a WHERE condition from a dictionary (AND logic).
+        List, tuple and set values are matched with IN.
+        
+        Returns:
+            Tuple of condition string and parameters, or (None, []) if an
+            empty IN list makes the condition match nothing
+        """
+        conditions = []
+        params = []
+        
+        for key, value in where.items():
+            if isinstance(value, (list, tuple, set)):
+                if not value:
+                    return None, []
+                conditions.append(f"`{key}` IN ({', '.join(['%s'] * len(value))})")
+                params.extend(value)
+            else:
+                conditions.append(f"`{key}` = %s")
+                params.append(value)
+        
+        return ' AND '.join(conditions), params
+    
     def select_one(self, table: str, columns: List[str] = None, 
                    where: Dict[str, Any] = None) -> Optional[Dict[str, Any]]:
         """
@@ -496,9 +802,143 @@ class SQLConnector:
     def close_pool(self):
         """Close all connections in the pool."""
         if self.pool:
-            # MySQL Connector doesn't have a direct close_pool method
-            # but connections will be closed when pool is garbage collected
+            # MySQL Connector has no public method to close a pool, this
+            # closes the idle connections (all of them when nothing runs)
+            self.pool._remove_connections()
             self.pool = None
+    
+    def reset_pool(self, pool_size: Optional[int] = None):
+        """
+        Create a new connection pool. Used by worker processes of a
+        multi-process server, which must not share the parent's connections
+        (the parent closes its pool before forking).
+        
+        Args:
+            pool_size: Number of connections (default: database.pool_size)
+        """
+        self._initialize_pool(pool_size)
+
+
+class AsyncSQLConnector:
+    """
+    Async counterpart of SQLConnector's CRUD methods for async views.
+    
+    Flask runs every async view in its own event loop, so a driver with
+    loop-bound connections (aiomysql) can't share a pool across requests.
+    Instead the calls run on the shared connection pool in a small thread
+    pool, and a view can await several of them (or other blocking work)
+    concurrently with asyncio.gather().
+    
+    The executor threads check connections out of the same pool as the
+    request threads. The production server counts them in the pool size
+    (see gunicorn.conf.py) and checkouts beyond it wait for a free
+    connection. Inside sql.transaction() calls run directly on the
+    transaction's connection, one at a time.
+    """
+    
+    def __init__(self, connector: SQLConnector, max_workers: int = ASYNC_SQL_WORKERS):
+        """
+        Args:
+            connector: Synchronous connector to run the calls on
+            max_workers: Maximum number of calls running at the same time
+        """
+        self._sql = connector
+        self._max_workers = max_workers
+        self._executor = None
+        self._executor_pid = None
+        self._executor_lock = threading.Lock()
+    
+    def _get_executor(self) -> ThreadPoolExecutor:
+        # Created per process, worker threads don't survive a fork
+        if self._executor_pid != os.getpid():
+            with self._executor_lock:
+                if self._executor_pid != os.getpid():
+                    self._executor = ThreadPoolExecutor(max_workers=self._max_workers,
+                                                        thread_name_prefix="async-sql")
+                    self._executor_pid = os.getpid()
+        return self._executor
+    
+    async def run(self, function: Callable, *args, **kwargs) -> Any:
+        """
+        Run a blocking function that uses the database without blocking the event loop.
+        The caller's context (query statistics) is passed along.
+        
+        Args:
+            function: Callable to run
+            *args, **kwargs: Arguments for the callable
+        
+        Returns:
+            The callable's return value
+        
+        Example:
+            lines, operators = await asyncio.gather(
+                async_sql.run(LineController.get_all_lines),
+                async_sql.run(OperatorController.get_all_operators)
+            )
+        """
+        if _current_transaction.get() is not None:
+            return function(*args, **kwargs)
+        
+        context = copy_context()
+        return await asyncio.get_running_loop().run_in_executor(
+            self._get_executor(), lambda: context.run(function, *args, **kwargs)
+        )
+    
+    async def insert(self, table: str, data: Dict[str, Any]) -> Optional[int]:
+        """Async SQLConnector.insert()."""
+        return await self.run(self._sql.insert, table, data)
+    
+    async def insert_many(self, table: str, columns: List[str], data: List[Tuple]) -> int:
+        """Async SQLConnector.insert_many()."""
+        return await self.run(self._sql.insert_many, table, columns, data)
+    
+    async def select(self, table: str, columns: List[str] = None,
+                     where: Dict[str, Any] = None,
+                     order_by: str = None,
+                     limit: int = None) -> List[Dict[str, Any]]:
+        """Async SQLConnector.select()."""
+        return await self.run(self._sql.select, table, columns, where, order_by, limit)
+    
+    async def select_one(self, table: str, columns: List[str] = None,
+                         where: Dict[str, Any] = None) -> Optional[Dict[str, Any]]:
+        """Async SQLConnector.select_one()."""
+        return await self.run(self._sql.select_one, table, columns, where)
+    
+    async def select_by_id(self, table: str, record_id: int,
+                           id_column: str = 'id') -> Optional[Dict[str, Any]]:
+        """Async SQLConnector.select_by_id()."""
+        return await self.run(self._sql.select_by_id, table, record_id, id_column)
+    
+    async def execute_query(self, query: str, params: Tuple = None) -> List[Dict[str, Any]]:
+        """Async SQLConnector.execute_query()."""
+        return await self.run(self._sql.execute_query, query, params)
+    
+    async def update(self, table: str, data: Dict[str, Any],
+                     where: Dict[str, Any]) -> int:
+        """Async SQLConnector.update()."""
+        return await self.run(self._sql.update, table, data, where)
+    
+    async def update_by_id(self, table: str, record_id: int, data: Dict[str, Any],
+                           id_column: str = 'id') -> bool:
+        """Async SQLConnector.update_by_id()."""
+        return await self.run(self._sql.update_by_id, table, record_id, data, id_column)
+    
+    async def delete(self, table: str, where: Dict[str, Any]) -> int:
+        """Async SQLConnector.delete()."""
+        return await self.run(self._sql.delete, table, where)
+    
+    async def delete_by_id(self, table: str, record_id: int,
+                           id_column: str = 'id') -> bool:
+        """Async SQLConnector.delete_by_id()."""
+        return await self.run(self._sql.delete_by_id, table, record_id, id_column)
+    
+    async def exists(self, table: str, where: Dict[str, Any]) -> bool:
+        """Async SQLConnector.exists()."""
+        return await self.run(self._sql.exists, table, where)
+    
+    async def count(self, table: str, where: Dict[str, Any] = None) -> int:
+        """Async SQLConnector.count()."""
+        return await self.run(self._sql.count, table, where)
 
 
 # Global SQL connector instance
@@ -507,3 +947,5 @@ try:
 except Exception as e:
     logger.error(f"Failed to initialize SQL connector: {e}")
     sql = None
+
+async_sql = AsyncSQLConnector(sql) if sql is not None else None
@@ -1,20 +1,107 @@
+from concurrent.futures import ThreadPoolExecutor, wait
 from core import main_dir
+from core.cache import TTLCache
+from core.config import config
+from requests.adapters import HTTPAdapter
+import asyncio
+import os
 import requests
+import threading
+import time
 
+try:
+    import fcntl
+except ImportError:
+    # Windows, only needed when worker processes share the user cache
+    fcntl = None
+
+from core.logger import Logger
 from core.url import DISCORD_API_URL
 
+logger = Logger("@discord")
+
+DISCORD_USER_CACHE_TTL = 60 * 60 * 24
+# Stale user data is still served (and refreshed in the background) for this long
+DISCORD_USER_STALE_TTL = 60 * 60 * 24 * 7
+# Failed lookups are remembered briefly so an unreachable API isn't hit on every view
+DISCORD_USER_FAILURE_TTL = 60 * 5
+# The refresher renews known users this long before their data becomes stale
+DISCORD_REFRESH_AHEAD = 60 * 60
+DISCORD_REFRESH_INTERVAL = 60 * 10
+# Processes that don't run the refresher reload the saved user cache this often
+DISCORD_CACHE_RELOAD_INTERVAL = 30
+# Held by the one process that refreshes known users and saves the user cache
+DISCORD_REFRESHER_LOCK = os.path.join(main_dir, "run", "discord_refresher.lock")
+
+discord_user_cache = TTLCache(
+    "discord_users",
+    max_size=2048,
+    ttl=DISCORD_USER_CACHE_TTL,
+    stale_ttl=DISCORD_USER_STALE_TTL,
+    persist_path=os.path.join(main_dir, "discord_user_cache.json")
+)
+
+DISCORD_FETCH_WORKERS = 8
+
+# Keep-alive connections to the Discord API, shared by all threads
+# (room for the batch workers plus single lookups from request threads)
+_discord_session = requests.Session()
+_discord_session.mount(DISCORD_API_URL, HTTPAdapter(pool_connections=1, pool_maxsize=DISCORD_FETCH_WORKERS * 2))
+_discord_executor = ThreadPoolExecutor(max_workers=DISCORD_FETCH_WORKERS, thread_name_prefix="discord")
+
+# Monotonic time until which the Discord API asked us to stop sending requests
+_discord_rate_limit_until = 0.0
+_discord_rate_limit_lock = threading.Lock()
+
+
 def load_secret():
     with open(main_dir + "/secret.key", "r") as _secret:
         return _secret.read()
 
 
-def fetch_discord_user(user_id, bot_token):
+def _wait_for_discord_rate_limit(deadline):
+    """Sleep until the rate limit is over. Returns False if that is after the deadline."""
+    wait_time = _discord_rate_limit_until - time.monotonic()
+    if wait_time <= 0:
+        return True
+    if time.monotonic() + wait_time > deadline:
+        return False
+    time.sleep(wait_time)
+    return True
+
+
+def _update_discord_rate_limit(response):
+    """Remember when requests may be sent again, from Discord's rate limit headers."""
+    global _discord_rate_limit_until
+    
+    reset_after = None
+    if response.status_code == 429:
+        reset_after = response.headers.get('Retry-After')
+    elif response.headers.get('X-RateLimit-Remaining') == '0':
+        reset_after = response.headers.get('X-RateLimit-Reset-After')
+    
+    if reset_after is None:
+        return
+    
+    try:
+        until = time.monotonic() + float(reset_after)
+    except ValueError:
+        return
+    
+    with _discord_rate_limit_lock:
+        _discord_rate_limit_until = max(_discord_rate_limit_until, until)
+
+
+def fetch_discord_user(user_id, bot_token, timeout=10):
     """
     Fetch Discord user data from Discord API
+    Uses a shared keep-alive session and respects Discord's rate limits,
+    waiting for a reset (and retrying a 429 once) only within the timeout.
     
     Args:
         user_id: Discord user ID
         bot_token: Discord bot token
+        timeout: Maximum time in seconds for the whole lookup
         
     Returns:
         dict: User data with keys: id, username, display_name, avatar_url, discriminator, bot, system
@@ -30,7 +117,21 @@ def fetch_discord_user(user_id, bot_token):
             'Content-Type': 'application/json'
         }
         
-        response = requests.get(url, headers=headers, timeout=10)
+        deadline = time.monotonic() + timeout
+        
+        for _ in range(2):
+            if not _wait_for_discord_rate_limit(deadline):
+                return None
+            
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                return None
+            
+            response = _discord_session.get(url, headers=headers, timeout=remaining)
+            _update_discord_rate_limit(response)
+            
+            if response.status_code != 429:
+                break
         
         if response.status_code != 200:
             return None
@@ -64,3 +165,254 @@ def fetch_discord_user(user_id, bot_token):
         
     except Exception:
         return None
+
+
+def _fetch_and_cache_discord_user(user_id, timeout=10):
+    """Fetch a Discord user and store the result (or the failure) in the user cache."""
+    user_data = fetch_discord_user(user_id, config.discord_bot_token, timeout=timeout)
+    if user_data is None:
+        discord_user_cache.set(user_id, False, ttl=DISCORD_USER_FAILURE_TTL)
+    else:
+        discord_user_cache.set(user_id, user_data)
+    
+    return user_data
+
+
+def _get_cached_discord_user(user_id):
+    """
+    Look up a user in the cache, counting hits, misses and stale hits.
+    Stale data is returned as is and a background refresh is queued.
+    
+    Returns:
+        Tuple of whether the user was cached and the user data (None for a cached failure)
+    """
+    # False marks a cached failure, None a cache miss
+    user_data, stale = discord_user_cache.get_stale(user_id)
+    if user_data is None:
+        discord_user_refresher.count('misses')
+        return False, None
+    
+    if stale:
+        discord_user_refresher.count('stale')
+        discord_user_refresher.enqueue(user_id)
+    else:
+        discord_user_refresher.count('hits')
+    
+    return True, user_data or None
+
+
+def get_discord_user(user_id):
+    """
+    Get Discord user data, served from the shared user cache if possible.
+    Stale data is served while it is refreshed in the background; only a
+    cache miss calls the Discord API (see fetch_discord_user) right away.
+    
+    Args:
+        user_id: Discord user ID
+        
+    Returns:
+        dict: User data as returned by fetch_discord_user or None if it could not be fetched
+    """
+    user_id = str(user_id)
+    cached, user_data = _get_cached_discord_user(user_id)
+    if cached:
+        return user_data
+    
+    return _fetch_and_cache_discord_user(user_id)
+
+
+def get_discord_users(user_ids, deadline=3):
+    """
+    Get Discord user data for many users at once.
+    Stale data is served while it is refreshed in the background. Cache
+    misses are fetched concurrently; users that aren't resolved within
+    the deadline are returned as None and are cached by their lookup in
+    the background once it finishes.
+    
+    Args:
+        user_ids: Discord user IDs
+        deadline: Maximum time in seconds to wait for all lookups
+        
+    Returns:
+        dict: User ID -> user data as returned by fetch_discord_user or None
+    """
+    users = {}
+    futures = {}
+    
+    for user_id in map(str, user_ids):
+        if user_id in users or user_id in futures:
+            continue
+        
+        cached, user_data = _get_cached_discord_user(user_id)
+        if cached:
+            users[user_id] = user_data
+        else:
+            futures[user_id] = _discord_executor.submit(_fetch_and_cache_discord_user, user_id, deadline)
+    
+    if futures:
+        wait(futures.values(), timeout=deadline)
+    
+    for user_id, future in futures.items():
+        users[user_id] = future.result() if future.done() and not future.exception() else None
+    
+    return users
+
+
+async def get_discord_user_async(user_id):
+    """
+    Async get_discord_user(). A cache miss is fetched on the Discord
+    executor, so the event loop is free while the API call runs.
+    
+    Args:
+        user_id: Discord user ID
+        
+    Returns:
+        dict: User data as returned by fetch_discord_user or None if it could not be fetched
+    """
+    user_id = str(user_id)
+    cached, user_data = _get_cached_discord_user(user_id)
+    if cached:
+        return user_data
+    
+    return await asyncio.wrap_future(_discord_executor.submit(_fetch_and_cache_discord_user, user_id))
+
+
+def _known_discord_user_ids():
+    """IDs of all users that are operator members or have requested an operator."""
+    from core.controller import OperatorController, OperatorRequestController
+    
+    user_ids = set(OperatorRequestController.get_requester_ids())
+    for operator in OperatorController.get_all_operators() or []:
+        user_ids.update(operator['users'])
+    
+    return user_ids
+
+
+class DiscordUserRefresher:
+    """
+    Background worker that keeps the Discord user cache fresh.
+    Refreshes queued (stale) users and, every DISCORD_REFRESH_INTERVAL,
+    all known users whose data becomes stale within DISCORD_REFRESH_AHEAD.
+    Also keeps the cache hit/miss/stale counters.
+    
+    With several worker processes only the one holding the refresher lock
+    refreshes the known users and saves the user cache. The others only
+    refresh users queued in them, reload the saved cache every
+    DISCORD_CACHE_RELOAD_INTERVAL and take over when that process exits.
+    """
+    
+    def __init__(self):
+        self._queue = set()
+        self._condition = threading.Condition()
+        self._thread = None
+        self._lock_file = None
+        self._owner = False
+        self._stats = {'hits': 0, 'misses': 0, 'stale': 0, 'refreshed': 0}
+        self._stats_lock = threading.Lock()
+    
+    def count(self, counter):
+        """Increase one of the counters by one."""
+        with self._stats_lock:
+            self._stats[counter] += 1
+    
+    def get_stats(self):
+        """
+        Returns:
+            dict: Cache hits, misses, stale hits, refreshed users and queued refreshes
+        """
+        with self._stats_lock:
+            stats = dict(self._stats)
+        stats['queued'] = len(self._queue)
+        return stats
+    
+    def enqueue(self, user_id):
+        """Queue a user for refreshing. Never blocks on the Discord API."""
+        with self._condition:
+            self._queue.add(str(user_id))
+            self._condition.notify()
+    
+    def start(self):
+        """Start the worker thread (once), if a bot token is configured."""
+        with self._condition:
+            if self._thread is not None and self._thread.is_alive():
+                return
+            
+            if not self._take_over():
+                discord_user_cache.follow_persist_file()
+            
+            if not config.discord_bot_token or config.discord_bot_token == "YOUR_BOT_TOKEN_HERE":
+                return
+            
+            self._thread = threading.Thread(target=self._run, name="discord-refresher", daemon=True)
+            self._thread.start()
+    
+    def _take_over(self):
+        """
+        Become the process that refreshes the known users and saves the
+        user cache, unless another process already is.
+        
+        Returns:
+            bool: Whether this process is (now) that process
+        """
+        if self._owner or fcntl is None:
+            self._owner = True
+            return True
+        
+        try:
+            if self._lock_file is None:
+                os.makedirs(os.path.dirname(DISCORD_REFRESHER_LOCK), exist_ok=True)
+                self._lock_file = open(DISCORD_REFRESHER_LOCK, 'a')
+            fcntl.flock(self._lock_file, fcntl.LOCK_EX | fcntl.LOCK_NB)
+        except OSError:
+            return False
+        
+        # Continue from what the previous owner saved
+        discord_user_cache.reload()
+        discord_user_cache.follow_persist_file(False)
+        self._owner = True
+        logger.info(f"Refreshing Discord users in process {os.getpid()}")
+        return True
+    
+    def _run(self):
+        next_scan = 0.0
+        
+        while True:
+            if time.monotonic() >= next_scan:
+                if self._take_over():
+                    next_scan = time.monotonic() + DISCORD_REFRESH_INTERVAL
+                    try:
+                        self._enqueue_expiring()
+                    except Exception as e:
+                        logger.error(f"Error collecting Discord users to refresh: {str(e)}")
+                else:
+                    next_scan = time.monotonic() + DISCORD_CACHE_RELOAD_INTERVAL
+                    discord_user_cache.reload()
+            
+            with self._condition:
+                if not self._queue:
+                    self._condition.wait(timeout=max(next_scan - time.monotonic(), 0))
+                    continue
+                user_id = self._queue.pop()
+            
+            self._refresh(user_id)
+    
+    def _refresh(self, user_id):
+        """Refresh one user. On failure the old data is kept and retried later."""
+        user_data = fetch_discord_user(user_id, config.discord_bot_token)
+        if user_data is None:
+            old_data, _ = discord_user_cache.get_stale(user_id)
+            discord_user_cache.set(user_id, old_data or False, ttl=DISCORD_USER_FAILURE_TTL)
+            return
+        
+        discord_user_cache.set(user_id, user_data)
+        self.count('refreshed')
+    
+    def _enqueue_expiring(self):
+        """Queue all known users that are missing or about to become stale."""
+        for user_id in _known_discord_user_ids():
+            stale_in = discord_user_cache.stale_in(user_id)
+            if stale_in is None or stale_in < DISCORD_REFRESH_AHEAD:
+                self.enqueue(user_id)
+
+
+discord_user_refresher = DiscordUserRefresher()
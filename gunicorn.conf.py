@@ -0,0 +1,82 @@
+"""
+    --- Production server ---
+    uv run gunicorn -c gunicorn.conf.py core.app:app
+
+    The app is loaded once in the master process (migrations and cache
+    warm-up run once) and forked into worker processes. Each worker serves
+    requests from a pool of threads; Flask runs async views in the request
+    thread with asgiref, so a threaded worker is used (no gevent/eventlet).
+    Every open /api/lines/stream connection occupies one thread for as long
+    as the page is open. Each worker therefore gets webserver.max_streams
+    threads for streams on top of its webserver.threads request threads; at
+    most that many streams are accepted per worker (above that the stream
+    answers 503 and the homepage polls for line changes instead), so streams
+    can never take the threads of regular requests. Streams wait for line
+    changes without a database connection (the shared line snapshot is
+    reloaded once per change), so only the request threads are counted for
+    the database pool.
+
+    Signals to the master:
+    - HUP: graceful reload, new workers are started before the old ones stop
+    - USR2 then TERM to the old master: load new code without downtime
+"""
+
+from core import main_dir
+from core.cache import share_versions
+from core.config import config
+
+import multiprocessing
+import os
+
+# A write in one worker must invalidate the caches of all workers. Set up
+# before the app (and with it the caches) is loaded.
+share_versions(os.path.join(main_dir, "run", "versions"))
+
+from core.sql import ASYNC_SQL_WORKERS
+
+# Connections kept free for migrations, admin tools and the master
+RESERVED_CONNECTIONS = 10
+# Pool connections per worker for background threads (Discord refresher) and spare
+EXTRA_CONNECTIONS = 2
+# Maximum pool size of mysql-connector
+MAX_POOL_SIZE = 32
+
+bind = f"{config.host}:{config.port}"
+preload_app = True
+
+worker_class = "gthread"
+request_threads = max(1, min(config.threads, MAX_POOL_SIZE - ASYNC_SQL_WORKERS - EXTRA_CONNECTIONS))
+# Threads reserved for /api/lines/stream (see core.routes.api.stream_lines)
+stream_threads = max(1, config.max_streams)
+threads = request_threads + stream_threads
+# Request threads and the async views' database threads (core.sql.async_sql)
+# all check connections out of the worker's pool
+pool_size = request_threads + ASYNC_SQL_WORKERS + EXTRA_CONNECTIONS
+
+# One worker per core, as many as fit into the database's max_connections
+workers = config.workers or multiprocessing.cpu_count()
+workers = max(1, min(workers, (config.db_max_connections - RESERVED_CONNECTIONS) // pool_size))
+
+timeout = 60
+graceful_timeout = 30
+keepalive = 5
+
+
+def when_ready(server):
+    server.log.info(f"{workers} workers x ({request_threads} request + {stream_threads} stream threads), "
+                    f"{pool_size} database connections per worker")
+
+
+def pre_fork(server, worker):
+    # The master's connections (used while loading the app) must not be
+    # shared with the workers
+    from core.sql import sql
+    sql.close_pool()
+
+
+def post_fork(server, worker):
+    from core.app import start_background_tasks
+    from core.sql import sql
+
+    sql.reset_pool(pool_size)
+    start_background_tasks()
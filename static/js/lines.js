@@ -33,166 +33,294 @@ async function getOperatorColor(operatorUid) {
     }
 }
 
+// Poll interval when the server has no stream slot left
+const LINES_POLL_INTERVAL = 30000;
+
 let linesData = [];
+let linesVersion = null;
+let boardRefreshTimer = null;
 
 function fetchLines() {
     fetch('/api/lines')
         .then(response => response.json())
         .then(data => {
-            const linesArray = data.lines || data;
-            linesData = linesArray;
-            const lines = {};
-            linesArray.forEach(line => {
-                lines[line.name] = line.color;
-            });
+            linesData = data.lines || data;
+            setupLineItems();
+        })
+        .catch(error => {
+            console.error('Error fetching lines:', error);
+        });
+}
 
-            document.querySelectorAll('.line-item').forEach(element => {
-                const lineName = element.dataset.line;
-                if (lines[lineName]) {
-                    element.style.backgroundColor = lines[lineName];
-                }
-            });
+function setupLineItems() {
+    const lines = {};
+    linesData.forEach(line => {
+        lines[line.name] = line.color;
+    });
 
-            const modal = document.getElementById("modal");
-            const modalContent = document.getElementById("modal-inner");
+    document.querySelectorAll('.line-item').forEach(element => {
+        const lineName = element.dataset.line;
+        if (lines[lineName]) {
+            element.style.backgroundColor = lines[lineName];
+            // The board's inline scripts don't run when it is re-rendered
+            element.style.color = getContrastColor(lines[lineName]);
+        }
+    });
 
-            // Remove any existing event listeners to prevent duplicates
-            document.querySelectorAll(".line").forEach(lineElement => {
-                // Clone the element to remove all event listeners
-                const newElement = lineElement.cloneNode(true);
-                lineElement.parentNode.replaceChild(newElement, lineElement);
-            });
+    const modalContent = document.getElementById("modal-inner");
 
-            // Add fresh event listeners
-            document.querySelectorAll(".line").forEach(lineElement => {
-                lineElement.addEventListener("click", async () => {
-                    const clickedLineName = lineElement.dataset.line;
-                    const lineData = linesData.find(line => line.name === clickedLineName);
-
-                    if (lineData) {
-                        const statusEmoji = (() => {
-                            switch(lineData.status) {
-                                case 'Running': return '✅';
-                                case 'Possible delays': return '⚠️';
-                                case 'No scheduled service': return '🌙';
-                                case 'Partially suspended': return '〽️';
-                                case 'Suspended': return '🚫';
-                                default: return '';
-                            }
-                        })();
-
-                        const operatorColor = await getOperatorColor(lineData.operator_uid);
-
-                        const operatorName = await fetch('/api/operators')
-                            .then(response => response.json())
-                            .then(operators => {
-                                const operator = operators.find(op => op.uid === lineData.operator_uid);
-                                return operator?.name || 'Unknown Operator';
-                            })
-                            .catch(error => {
-                                console.error('Error fetching operator name:', error);
-                                return 'Unknown Operator';
-                            });
+    // Remove any existing event listeners to prevent duplicates
+    document.querySelectorAll(".line").forEach(lineElement => {
+        // Clone the element to remove all event listeners
+        const newElement = lineElement.cloneNode(true);
+        lineElement.parentNode.replaceChild(newElement, lineElement);
+    });
 
-                        const fgColor = getContrastColor(lineData.color);
-                        const operatorFgColor = getContrastColor(operatorColor);
-
-                        modalContent.innerHTML = `
-                            <div style="display: flex; align-items: center">
-                                <h1 class="line-modal" style="background-color: ${lineData.color}; color: ${fgColor}">${lineData.name}</h1>
-                                <span style="margin-left: 16px; background-color: ${operatorColor}; color: ${operatorFgColor}" class="line-modal" onclick="window.location.href = '/operators/${lineData.operator_uid || ''}'">${operatorName || ''}</span>
-                            </div>
-                            <h3>${statusEmoji} ${lineData.status || 'No description available'}</h3>
-                            <p>${(lineData.notice && lineData.notice.trim() !== '') ? lineData.notice.trim() : 'No notice available'}</p>
-                            <hr>
-                        `;
-
-                        if (!lineData.stations || lineData.stations.length === 0) {
-                            modalContent.innerHTML += `<p>Station list not available</p>`;
-                        } else {
-                            modalContent.innerHTML += `<h2>Stations</h2>`;
-                            const ul = document.createElement("ul");
-                            if (lineData.stations.length === 1 && lineData.stations[0].startsWith('<content:html>')) {
-                                modalContent.innerHTML += lineData.stations[0].replace('<content:html>', '').replace("<script>", "").replace("</script>", "");
-                            } else {
-                                lineData.stations.forEach(station => {
-                                    const li = document.createElement("li");
-                                    li.innerHTML = station;
-                                    ul.appendChild(li);
-                                });
-                                modalContent.appendChild(ul);
-                            }
-                        }
+    // Add fresh event listeners
+    document.querySelectorAll(".line").forEach(lineElement => {
+        lineElement.addEventListener("click", async () => {
+            const clickedLineName = lineElement.dataset.line;
+            const lineData = linesData.find(line => line.name === clickedLineName);
 
-                        // Add train composition(s)
-                        const compositions = lineData.compositions || (lineData.composition ? [lineData.composition] : []);
+            if (lineData) {
+                const statusEmoji = (() => {
+                    switch(lineData.status) {
+                        case 'Running': return '✅';
+                        case 'Possible delays': return '⚠️';
+                        case 'No scheduled service': return '🌙';
+                        case 'Partially suspended': return '〽️';
+                        case 'Suspended': return '🚫';
+                        default: return '';
+                    }
+                })();
+
+                const operatorColor = await getOperatorColor(lineData.operator_uid);
+
+                const operatorName = await fetch('/api/operators')
+                    .then(response => response.json())
+                    .then(operators => {
+                        const operator = operators.find(op => op.uid === lineData.operator_uid);
+                        return operator?.name || 'Unknown Operator';
+                    })
+                    .catch(error => {
+                        console.error('Error fetching operator name:', error);
+                        return 'Unknown Operator';
+                    });
+
+                const fgColor = getContrastColor(lineData.color);
+                const operatorFgColor = getContrastColor(operatorColor);
+
+                modalContent.innerHTML = `
+                    <div style="display: flex; align-items: center">
+                        <h1 class="line-modal" style="background-color: ${lineData.color}; color: ${fgColor}">${lineData.name}</h1>
+                        <span style="margin-left: 16px; background-color: ${operatorColor}; color: ${operatorFgColor}" class="line-modal" onclick="window.location.href = '/operators/${lineData.operator_uid || ''}'">${operatorName || ''}</span>
+                    </div>
+                    <h3>${statusEmoji} ${lineData.status || 'No description available'}</h3>
+                    <p>${(lineData.notice && lineData.notice.trim() !== '') ? lineData.notice.trim() : 'No notice available'}</p>
+                    <hr>
+                `;
+
+                if (!lineData.stations || lineData.stations.length === 0) {
+                    modalContent.innerHTML += `<p>Station list not available</p>`;
+                } else {
+                    modalContent.innerHTML += `<h2>Stations</h2>`;
+                    const ul = document.createElement("ul");
+                    if (lineData.stations.length === 1 && lineData.stations[0].startsWith('<content:html>')) {
+                        modalContent.innerHTML += lineData.stations[0].replace('<content:html>', '').replace("<script>", "").replace("</script>", "");
+                    } else {
+                        lineData.stations.forEach(station => {
+                            const li = document.createElement("li");
+                            li.innerHTML = station;
+                            ul.appendChild(li);
+                        });
+                        modalContent.appendChild(ul);
+                    }
+                }
+
+                // Add train composition(s)
+                const compositions = lineData.compositions || (lineData.composition ? [lineData.composition] : []);
+                
+                if (compositions.length > 0 && compositions.some(c => {
+                    if (typeof c === 'string') return c.trim() !== '';
+                    if (typeof c === 'object') return c.parts && c.parts.trim() !== '';
+                    return false;
+                })) {
+                    const compositionDiv = document.createElement("div");
+                    compositionDiv.style.marginTop = "20px";
+                    compositionDiv.innerHTML = `<h2>Train Composition${compositions.length > 1 ? 's' : ''}</h2>`;
+                    
+                    compositions.forEach((composition, index) => {
+                        let parts = '';
+                        let variantName = '';
                         
-                        if (compositions.length > 0 && compositions.some(c => {
-                            if (typeof c === 'string') return c.trim() !== '';
-                            if (typeof c === 'object') return c.parts && c.parts.trim() !== '';
-                            return false;
-                        })) {
-                            const compositionDiv = document.createElement("div");
-                            compositionDiv.style.marginTop = "20px";
-                            compositionDiv.innerHTML = `<h2>Train Composition${compositions.length > 1 ? 's' : ''}</h2>`;
+                        // Handle both old format (string) and new format (object)
+                        if (typeof composition === 'string') {
+                            parts = composition;
+                        } else if (composition && typeof composition === 'object') {
+                            parts = composition.parts || '';
+                            variantName = composition.name || '';
+                        }
+                        
+                        if (parts && parts.trim() !== '') {
+                            if (compositions.length > 1 || variantName) {
+                                const variantLabel = document.createElement("h3");
+                                variantLabel.textContent = variantName || `Variant ${index + 1}`;
+                                variantLabel.style.marginTop = index > 0 ? "15px" : "0";
+                                variantLabel.style.marginBottom = "8px";
+                                compositionDiv.appendChild(variantLabel);
+                            }
                             
-                            compositions.forEach((composition, index) => {
-                                let parts = '';
-                                let variantName = '';
-                                
-                                // Handle both old format (string) and new format (object)
-                                if (typeof composition === 'string') {
-                                    parts = composition;
-                                } else if (composition && typeof composition === 'object') {
-                                    parts = composition.parts || '';
-                                    variantName = composition.name || '';
-                                }
-                                
-                                if (parts && parts.trim() !== '') {
-                                    if (compositions.length > 1 || variantName) {
-                                        const variantLabel = document.createElement("h3");
-                                        variantLabel.textContent = variantName || `Variant ${index + 1}`;
-                                        variantLabel.style.marginTop = index > 0 ? "15px" : "0";
-                                        variantLabel.style.marginBottom = "8px";
-                                        compositionDiv.appendChild(variantLabel);
-                                    }
-                                    
-                                    const compositionDisplay = document.createElement("div");
-                                    compositionDisplay.className = "composition-display";
-                                    
-                                    parts.split(',').forEach(part => {
-                                        const partDiv = document.createElement("div");
-                                        partDiv.className = "composition-part-display";
-                                        partDiv.style.backgroundImage = `url('/static/assets/icons/${part}.png')`;
-                                        partDiv.title = part.toUpperCase();
-                                        compositionDisplay.appendChild(partDiv);
-                                    });
-                                    
-                                    compositionDiv.appendChild(compositionDisplay);
-                                }
+                            const compositionDisplay = document.createElement("div");
+                            compositionDisplay.className = "composition-display";
+                            
+                            parts.split(',').forEach(part => {
+                                const partDiv = document.createElement("div");
+                                partDiv.className = "composition-part-display";
+                                partDiv.style.backgroundImage = `url('/static/assets/icons/${part}.png')`;
+                                partDiv.title = part.toUpperCase();
+                                compositionDisplay.appendChild(partDiv);
                             });
                             
-                            modalContent.appendChild(compositionDiv);
+                            compositionDiv.appendChild(compositionDisplay);
                         }
+                    });
+                    
+                    modalContent.appendChild(compositionDiv);
+                }
 
-                        openModal();
-                    }
+                openModal();
+            }
+        });
+    });
+}
+
+function refreshBoard() {
+    fetch('/api/lines/board')
+        .then(response => {
+            if (!response.ok) {
+                throw new Error(`HTTP ${response.status}`);
+            }
+            return response.text();
+        })
+        .then(html => {
+            const board = document.getElementById('line-board');
+            if (!board) {
+                return;
+            }
+
+            const activeTab = document.querySelector('.tab-btn.active')?.dataset.tab;
+            board.outerHTML = html;
+
+            if (activeTab) {
+                document.querySelectorAll('#line-board .tab-content').forEach(content => {
+                    content.classList.toggle('active', content.id === activeTab);
                 });
-            });
+            }
+
+            setupLineItems();
         })
         .catch(error => {
-            console.error('Error fetching lines:', error);
+            console.error('Error refreshing line board:', error);
         });
 }
 
+function scheduleBoardRefresh() {
+    // A change can arrive as several events, re-render the board once
+    clearTimeout(boardRefreshTimer);
+    boardRefreshTimer = setTimeout(refreshBoard, 250);
+}
+
+function upsertLine(line) {
+    const index = linesData.findIndex(l => l.name === line.name);
+
+    if (index === -1) {
+        linesData.push(line);
+    } else {
+        linesData[index] = line;
+    }
+}
+
+function removeLine(name) {
+    linesData = linesData.filter(line => line.name !== name);
+}
+
+function subscribeLines() {
+    // Resume from the version the board was rendered for, so changes made
+    // before the stream connected aren't missed
+    linesVersion = document.getElementById('line-board')?.dataset.version || null;
+
+    if (!window.EventSource) {
+        pollLines();
+        return;
+    }
+
+    const source = new EventSource('/api/lines/stream' + (linesVersion ? `?since=${encodeURIComponent(linesVersion)}` : ''));
+
+    source.addEventListener('update', event => {
+        upsertLine(JSON.parse(event.data));
+        linesVersion = event.lastEventId;
+        scheduleBoardRefresh();
+    });
+
+    source.addEventListener('delete', event => {
+        removeLine(JSON.parse(event.data).name);
+        linesVersion = event.lastEventId;
+        scheduleBoardRefresh();
+    });
+
+    source.addEventListener('reset', event => {
+        linesData = JSON.parse(event.data).lines;
+        linesVersion = event.lastEventId;
+        scheduleBoardRefresh();
+    });
+
+    source.addEventListener('error', () => {
+        // Network errors reconnect by themselves; the stream is only closed
+        // for good when the server refuses it (503, no stream slot left)
+        if (source.readyState === EventSource.CLOSED) {
+            pollLines();
+        }
+    });
+}
+
+function pollLines() {
+    setInterval(() => {
+        fetch(`/api/lines?since=${encodeURIComponent(linesVersion ?? 0)}`)
+            .then(response => {
+                // On errors keep the data and version, the next poll asks again
+                if (!response.ok) {
+                    throw new Error(`HTTP ${response.status}`);
+                }
+                return response.json();
+            })
+            .then(delta => {
+                if (delta.full) {
+                    linesData = delta.lines;
+                } else if (delta.created.length || delta.updated.length || delta.deleted.length) {
+                    delta.created.concat(delta.updated).forEach(upsertLine);
+                    delta.deleted.forEach(removeLine);
+                } else {
+                    linesVersion = delta.version;
+                    return;
+                }
+
+                linesVersion = delta.version;
+                scheduleBoardRefresh();
+            })
+            .catch(error => {
+                console.error('Error polling line changes:', error);
+            });
+    }, LINES_POLL_INTERVAL);
+}
+
 document.addEventListener('DOMContentLoaded', function() {
     const tabs = document.querySelectorAll('.tab-btn');
-    const contents = document.querySelectorAll('.tab-content');
 
     tabs.forEach(tab => {
         tab.addEventListener('click', () => {
             tabs.forEach(t => t.classList.remove('active'));
-            contents.forEach(c => c.classList.remove('active'));
+            // Looked up on every click, the board is replaced on line changes
+            document.querySelectorAll('.tab-content').forEach(c => c.classList.remove('active'));
 
             tab.classList.add('active');
             const tabId = tab.dataset.tab;
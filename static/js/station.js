@@ -162,6 +162,7 @@ document.addEventListener('DOMContentLoaded', function() {
         document.getElementById('modalPlatformCount').textContent = '...';
         document.getElementById('modalStationType').textContent = '...';
         document.getElementById('modalLinesGrid').innerHTML = '<div style="text-align: center; padding: 20px; opacity: 0.7;">Loading lines...</div>';
+        document.getElementById('modalConnections').innerHTML = '';
         
         // Fetch detailed station data from API
         try {
@@ -200,6 +201,7 @@ document.addEventListener('DOMContentLoaded', function() {
 
                 // Populate real lines data
                 populateStationLines(lines);
+                populateStationConnections(stationData.connections || []);
             } else {
                 // Fallback to sample data if API fails
                 document.getElementById('modalPlatformCount').textContent = 'Unknown';
@@ -250,6 +252,36 @@ document.addEventListener('DOMContentLoaded', function() {
         `).join('');
     }
     
+    function populateStationConnections(connections) {
+        const connectionsGrid = document.getElementById('modalConnections');
+        
+        if (!connections || connections.length === 0) {
+            connectionsGrid.innerHTML = '<div style="text-align: center; padding: 20px; opacity: 0.7;">No connecting stations</div>';
+            return;
+        }
+        
+        connectionsGrid.innerHTML = '';
+        connections.forEach(connection => {
+            const item = document.createElement('button');
+            item.type = 'button';
+            item.className = 'modal-connection-item';
+            item.textContent = connection.station;
+            item.title = connection.lines.join(', ');
+            item.addEventListener('click', () => openConnectedStation(connection.station));
+            connectionsGrid.appendChild(item);
+        });
+    }
+    
+    function openConnectedStation(stationName) {
+        const card = Array.from(document.querySelectorAll('.station-card'))
+            .find(card => card.dataset.name === stationName);
+        if (!card) return;
+        
+        closeStationModal();
+        // Wait for the close animation before opening the next station
+        setTimeout(() => openStationModal(card, stationName, card.dataset.id), 320);
+    }
+    
     function populateSampleLines() {
         const sampleLines = [
             { name: 'Loading...', operator: 'Please wait', status: 'Fetching data', color: '#666' }
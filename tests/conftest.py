@@ -0,0 +1,105 @@
+import os
+import sys
+
+import pytest
+
+MAIN_DIR = os.path.dirname(os.path.dirname(os.path.realpath(__file__)))
+CONFIG_PATH = os.path.join(MAIN_DIR, "config.yml")
+
+sys.path.insert(0, MAIN_DIR)
+
+# core.config reads config.yml on import; use defaults if there is none
+_created_config = not os.path.exists(CONFIG_PATH)
+if _created_config:
+    with open(CONFIG_PATH, "w") as config_file:
+        config_file.write("{}\n")
+
+
+def pytest_sessionfinish(session, exitstatus):
+    if _created_config and os.path.exists(CONFIG_PATH):
+        os.remove(CONFIG_PATH)
+
+
+class FakeCursor:
+    """DB-API cursor answering queries from a responder function."""
+
+    def __init__(self, database):
+        self._database = database
+        self._rows = []
+        self.rowcount = 0
+        self.lastrowid = None
+
+    def execute(self, query, params=None):
+        self._database.executed.append((query, params))
+        self._rows = list(self._database.respond(query, params or ()))
+        self.rowcount = len(self._rows)
+
+    def executemany(self, query, seq_params):
+        seq_params = list(seq_params)
+        self._database.executed.append((query, seq_params))
+        self._rows = []
+        self.rowcount = len(seq_params)
+
+    def fetchone(self):
+        return self._rows.pop(0) if self._rows else None
+
+    def fetchall(self):
+        rows, self._rows = self._rows, []
+        return rows
+
+    def close(self):
+        pass
+
+
+class FakeConnection:
+    def __init__(self, database):
+        self._database = database
+
+    def cursor(self, dictionary=True):
+        return FakeCursor(self._database)
+
+    def commit(self):
+        pass
+
+    def rollback(self):
+        pass
+
+    def is_connected(self):
+        return True
+
+    def close(self):
+        pass
+
+
+class FakeDatabase:
+    """
+    Stands in for the connection pool. Every statement is recorded in
+    executed; respond(query, params) returns the rows of a query.
+    """
+
+    def __init__(self, **kwargs):
+        self.executed = []
+        self.respond = lambda query, params: []
+
+    def get_connection(self):
+        return FakeConnection(self)
+
+
+@pytest.fixture
+def fake_sql(monkeypatch):
+    """
+    A SQLConnector on a fake pool, patched into the controllers.
+    Yields (connector, database).
+    """
+    import core.sql
+    import core.controller.line
+    import core.controller.operator
+    import core.controller.station
+
+    monkeypatch.setattr(core.sql.pooling, "MySQLConnectionPool", FakeDatabase)
+    connector = core.sql.SQLConnector()
+
+    for module in (core.sql, core.controller.line, core.controller.operator, core.controller.station):
+        monkeypatch.setattr(module, "sql", connector)
+
+    yield connector, connector.pool
@@ -0,0 +1,84 @@
+"""
+Regression tests for the number of statements per page: the per-user and
+per-operator lookups must not go back to one query per row (N+1).
+"""
+
+from core.controller import LineController, OperatorController
+
+
+def count_queries(connector, function, *args):
+    token = connector.start_query_stats()
+    try:
+        result = function(*args)
+    finally:
+        stats = connector.stop_query_stats(token)
+    return result, stats.count
+
+
+def test_operators_by_user_uses_two_queries(fake_sql):
+    connector, database = fake_sql
+    operators = [
+        {'id': op_id, 'name': f'Operator {op_id}', 'color': '#ff0000', 'short': f'O{op_id}', 'uid': f'op{op_id}'}
+        for op_id in range(1, 21)
+    ]
+    members = [
+        {'operator_id': op_id, 'user_id': user_id}
+        for op_id in range(1, 21)
+        for user_id in (1000, 2000 + op_id, 3000 + op_id)
+    ]
+
+    def respond(query, params):
+        if 'FROM operator o' in query:
+            return operators
+        if 'FROM operator_user ou' in query:
+            return members
+        return []
+
+    database.respond = respond
+
+    result, queries = count_queries(connector, OperatorController.get_operators_by_user, '1000')
+
+    assert queries == 2
+    assert len(database.executed) == 2
+    assert len(result) == 20
+    assert result[4]['users'] == ['1000', '2005', '3005']
+
+
+def test_operators_by_user_without_operators_uses_one_query(fake_sql):
+    connector, database = fake_sql
+
+    result, queries = count_queries(connector, OperatorController.get_operators_by_user, '1000')
+
+    assert queries == 1
+    assert result == []
+
+
+def test_lines_by_operator_uses_two_queries(fake_sql):
+    connector, database = fake_sql
+    lines = [
+        {'id': line_id, 'name': f'S{line_id}', 'color': '#00ff00', 'status': 'Running', 'type': 'public',
+         'notice': '', 'operator_name': 'Operator', 'operator_uid': 'op1', 'stations': 'A||B||C'}
+        for line_id in range(1, 31)
+    ]
+    compositions = [
+        {'line_id': line_id, 'parts': f'loco,wagon{index}', 'comp_name': f'Variant {index}'}
+        for line_id in range(1, 31)
+        for index in range(20)
+    ]
+
+    def respond(query, params):
+        if 'FROM line l' in query:
+            return lines
+        if 'FROM line_composition lc' in query:
+            return compositions
+        return []
+
+    database.respond = respond
+
+    result, queries = count_queries(connector, LineController.get_lines_by_operator, 'op1')
+
+    assert queries == 2
+    assert len(database.executed) == 2
+    assert len(result) == 30
+    assert len(result[0]['compositions']) == 20
+    assert result[0]['stations'] == ['A', 'B', 'C']